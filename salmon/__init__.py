@@ -1,4 +1,11 @@
 from .expression import *
 from .model import *
+from .glm import *
+from .schema import *
 from .comparison import *
-from .building import *
\ No newline at end of file
+from .building import *
+from .predictor import *
+from .solvers import *
+from .serving import *
+from .shared import *
+from .sources import *
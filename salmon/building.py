@@ -1,11 +1,14 @@
 import numpy as np
+import pandas as pd
 import math
 
+from scipy.linalg import solve_triangular
+
 from abc import ABC, abstractmethod
 
 from .model import LinearModel
 from .comparison import _extract_dfs
-from .expression import Constant
+from .expression import Constant, Interaction
 
 
 class Score(ABC):
@@ -60,21 +63,7 @@ class RSquared(Score):
             A real value of the computed R^2 value.
         '''
 
-        X = self.model.training_data
-        y = self.model.training_y
-
-        pred = self.model.predict(X)
-        sse = ((y.iloc[:, 0] - pred.iloc[:, 0]) ** 2).sum()
-        ssto = ((y.iloc[:, 0] - y.iloc[:, 0].mean()) ** 2).sum()
-
-        if self.adjusted:
-            numerator = sse
-            denominator = ssto
-        else:
-            numerator = sse / (len(y) - len(self.model.X_train_.columns) - 2)
-            denominator = ssto / (len(y) - 1)
-
-        return 1 - numerator / denominator
+        return self.model.r_squared(adjusted=self.adjusted)
 
 
 class MSE(Score):
@@ -102,7 +91,7 @@ class MallowsCp(Score):
     def compute(self):
         dfs = _extract_dfs(self.model, dict_out=True)
         sse = self.model.get_sse()
-        sigma_sq = self.model.std_err_est ** 2
+        sigma_sq = self.model.resid_var_
         n, p = self.model.n, self.model.p
 
         return sse / sigma_sq - n + (2 * p)
@@ -148,19 +137,102 @@ _metrics = dict(
 )
 
 
-def stepwise(full_model, metric_name, forward=False, naive=False, data=None, verbose=False):
+def screen_collinear(expression, data, tol=1e-8, drop=True, intercept=True):
+    ''' Find terms whose columns are (nearly) linear combinations of earlier terms' columns, before fitting.
+
+    Main effects are considered before interactions, and otherwise terms are taken in alphabetical order. A correlation matrix of all the columns is built from one pass over the
+    design, and a Cholesky factor of the kept columns is grown one column at a time: a column is aliased when
+    its squared correlation with the span of the kept columns is within tol of 1 (i.e. its VIF exceeds 1 / tol).
+    A term is flagged if any of its columns are aliased.
+
+    Arguments:
+        expression - An Expression of explanatory terms.
+        data - A DataFrame containing the variables in the expression.
+        tol - A float tolerance on 1 - R^2 of a column against the kept columns.
+        drop - A boolean indicating if aliased terms should be dropped from the returned expression (True)
+            or only flagged (False).
+        intercept - A boolean indicating if the model will include an intercept (columns are then centered).
+
+    Returns:
+        A tuple containing the (screened) expression and a DataFrame reporting, for each term, the largest
+        VIF of its columns against the earlier kept terms and whether it was aliased.
+    '''
+    ex = expression.copy().interpret(data)
+    X = ex.evaluate(data)
+    if intercept:
+        X = X - X.mean()
+    gram = X.T.values @ X.values
+    scale = np.sqrt(np.diagonal(gram))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = gram / np.outer(scale, scale)
+    positions = {column: i for i, column in enumerate(X.columns)}
+
+    kept_terms, kept, factor = [], [], np.empty((0, 0))
+    labels, vifs, aliased = [], [], []
+    for term in sorted(ex.get_terms(), key=lambda term: (isinstance(term, Interaction), str(term))):
+        span = [positions[name] for name, func in term._compile() if name in positions]
+        if len(span) == 0:
+            continue
+        # Try to extend the factor with the term's columns, and only keep the extension if none are aliased
+        candidate, candidate_kept, worst = factor, list(kept), 1.0
+        is_aliased = False
+        for j in span:
+            if scale[j] == 0:
+                is_aliased, worst = True, np.inf
+                break
+            z = solve_triangular(candidate, correlation[candidate_kept, j], lower=True) if candidate_kept else np.empty(0)
+            schur = 1 - z @ z
+            worst = max(worst, 1 / schur if schur > 0 else np.inf)
+            if schur <= tol:
+                is_aliased = True
+                break
+            size = len(candidate_kept)
+            extended = np.zeros((size + 1, size + 1))
+            extended[:size, :size] = candidate
+            extended[size, :size] = z
+            extended[size, size] = np.sqrt(schur)
+            candidate, candidate_kept = extended, candidate_kept + [j]
+
+        labels.append(str(term))
+        vifs.append(worst)
+        aliased.append(is_aliased)
+        if not is_aliased or not drop:
+            kept_terms.append(term)
+        if not is_aliased:
+            factor, kept = candidate, candidate_kept
+
+    screened = None
+    for term in kept_terms:
+        screened = term if screened is None else screened + term
+    if screened is None:
+        screened = Constant(0)
+
+    report = pd.DataFrame({"VIF": vifs, "Aliased": aliased}, index=labels, columns=["VIF", "Aliased"])
+    return screened, report
+
+
+def stepwise(full_model, metric_name, forward=False, naive=False, data=None, verbose=False, sample=None, seed=None,
+             weights=None):
 
     if data is not None:
-        full_model.fit(data)
+        if sample is None:
+            full_model.fit(data, weights=weights)
+        else:
+            full_model.fit(data, sample=sample, seed=seed, weights=weights)
 
     metric_name = metric_name.lower()
 
     ex_terms = full_model.ex
     re_term = full_model.re
     data = full_model.training_data
+    # Candidate models are fit with the full model's weights (and on the same rows, if it was fit on a sample)
+    weights = full_model.weights_
 
     if ex_terms is None or re_term is None:
         raise AssertionError("The full model must be fit prior to undergoing a stepwise procedure.")
+    if data is None:
+        raise AssertionError("The full model must retain its training data (retain='summary' or higher), "
+                             "or data must be given, to undergo a stepwise procedure.")
 
     if metric_name not in _metrics:
         raise KeyError("Metric '{}' not supported. The following metrics are supported: {}".format(
@@ -172,8 +244,8 @@ def stepwise(full_model, metric_name, forward=False, naive=False, data=None, ver
 
     ex_term_list = ex_terms.get_terms()
     if forward:
-        best_model = LinearModel(Constant(1), re_term)
-        best_model.fit(data)
+        best_model = full_model._submodel(Constant(1), re_term)
+        best_model._fit(data, weights=weights)
     else:
         best_model = full_model
 
@@ -201,15 +273,15 @@ def stepwise(full_model, metric_name, forward=False, naive=False, data=None, ver
                     if not naive:
                         if term not in leaves:
                             continue
-                    potential_model = LinearModel(best_model.given_ex + term, re_term)
+                    potential_model = full_model._submodel(best_model.given_ex + term, re_term)
                 else:
                     # validate if removing term is valid
                     if not naive:
                         if (best_model.given_ex - term).contains(term):
                             continue
-                    potential_model = LinearModel(best_model.given_ex - term, re_term)
+                    potential_model = full_model._submodel(best_model.given_ex - term, re_term)
 
-                potential_model.fit(data)
+                potential_model._fit(data, weights=weights)
                 potential_metric = metric_func(potential_model)
 
                 if best_potential_metric.compare(potential_metric):
@@ -0,0 +1,84 @@
+import inspect
+
+from .expression import Categorical, _json_value, _bspline_band, _spline_band, _spline_basis
+
+_HEADER = '''# Generated from the fitted model {model}
+# Requires only NumPy.
+import numpy as np
+
+
+def _lookup(values, levels, effects):
+    """ Map each value to the effect of its level. Values that are not among the levels get the baseline effect of 0. """
+    values = np.asarray(values)
+    positions = np.clip(np.searchsorted(levels, values), 0, len(levels) - 1)
+    return np.where(levels[positions] == values, effects[positions], 0.0)
+'''
+
+
+def _sortable(levels):
+    ''' Lookup arrays rely on np.searchsorted, so the levels must have a consistent order. '''
+    try:
+        sorted(levels)
+        return True
+    except TypeError:
+        return False
+
+
+def _generate_source(model, function_name = "predict"):
+    ''' Write a standalone NumPy scoring function for a fitted LinearModel.
+
+    Coefficients are folded into the column expressions, main effect Categorical terms become
+    lookup arrays, and Transformations (including learned Center / Standardize statistics) are inlined.
+
+    Arguments:
+        model - A LinearModel that has been fit on some data.
+        function_name - A str name for the generated function.
+
+    Returns:
+        A str of Python source code. The generated function takes a mapping of column names to arrays
+        and returns an array of predictions.
+    '''
+    coefs = model.coef_
+    terms = model.ex.reduce()
+
+    # Every variable is read (and converted) once, up front
+    names = dict()
+    identifiers = []
+    reads = []
+    for kind, dtype in (("Q", ", dtype=float"), ("C", "")):
+        for i, var_name in enumerate(sorted(var.name for var in terms[kind])):
+            identifier = kind.lower() + str(i)
+            names[(kind, var_name)] = identifier
+            identifiers.append(identifier)
+            reads.append("    {} = np.asarray(columns[{!r}]{})".format(identifier, var_name, dtype))
+
+    tables = []
+    statements = []
+    for term in model.ex.get_terms():
+        if isinstance(term, Categorical) and _sortable(term.levels):
+            levels = sorted(_json_value(level) for level in term.levels)
+            effects = [0.0 if level in term.baseline else float(coefs[term.name + "{" + str(level) + "}"]) for level in levels]
+            k = len(tables)
+            tables.append("_LEVELS_{} = np.array({!r})\n_EFFECTS_{} = np.array({!r})".format(k, levels, k, effects))
+            statements.append("    out += _lookup({}, _LEVELS_{}, _EFFECTS_{})".format(names[("C", term.name)], k, k))
+        else:
+            for column, source in term._to_source(names):
+                statements.append("    out += {!r} * ({})".format(float(coefs[column]), source))
+
+    intercept = float(coefs["Intercept"]) if model.intercept else 0.0
+    # All columns are expected to have the same length
+    shape = "np.shape({})".format(identifiers[0]) if len(identifiers) > 0 else "()"
+
+    lines = [_HEADER.format(model = model)]
+    if any("_spline_basis(" in statement for statement in statements):
+        # Spline terms call the same NumPy helpers as Spline._compile
+        lines.extend(inspect.getsource(helper) for helper in (_bspline_band, _spline_band, _spline_basis))
+    lines.extend(tables)
+    lines.append("\n")
+    lines.append("def {}(columns):".format(function_name))
+    lines.append('    """ Predict {} from a mapping of column names to arrays. """'.format(model.re))
+    lines.extend(reads)
+    lines.append("    out = np.full({}, {!r})".format(shape, intercept))
+    lines.extend(statements)
+    lines.append("    return out")
+    return "\n".join(lines) + "\n"
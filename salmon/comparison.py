@@ -1,5 +1,7 @@
 from .model import *
-from scipy.stats import f
+from .model import _absorb_groups, _group_demean
+from .glm import GeneralizedLinearModel
+from scipy.stats import f, chi2
 
 import numpy as np
 import pandas as pd
@@ -17,11 +19,15 @@ def anova(model1, model2 = None):
         A DataFrame that contains relevant statistics for the test performed
     '''
     if model2 is None:
+        if isinstance(model1, GeneralizedLinearModel):
+            return _deviance_terms(model1)
+        if model1.cov_type_ != "nonrobust":
+            return _wald_terms(model1)
         return _anova_terms(model1)
     elif is_subset(model1, model2):
-        return _anova_models(model1, model2)
+        return _compare_models(model1, model2)
     elif is_subset(model2, model1):
-        return _anova_models(model2, model1)
+        return _compare_models(model2, model1)
     else:
         raise Exception("Parameters must either be one model or two models where one is a subset of the other.")
         
@@ -76,8 +82,8 @@ def _process_term(orig_model, term):
     Returns:
         A real value indicated the sum of squared residuals.
     '''
-    new_model = LinearModel(orig_model.given_ex - term, orig_model.given_re)
-    new_model.fit(orig_model.training_data)
+    new_model = orig_model._submodel(orig_model.given_ex - term)
+    new_model._fit(orig_model.training_data, weights=orig_model.weights_)
     return new_model.get_sse(), new_model.get_ssr()
 
 def _extract_dfs(model, dict_out=False):
@@ -93,8 +99,9 @@ def _extract_dfs(model, dict_out=False):
             Element 2 contains the total degrees of freedom for the model.
     '''
     reg_df = model.ex.get_dof()
-    total_df = len(model.X_train_) - 1
-    error_df = total_df - reg_df
+    # Absorbed effects (like the intercept) are accounted for in the residual degrees of freedom
+    error_df = model.rdf
+    total_df = model.n - (1 if model.intercept or model.absorb else 0)
 
     if dict_out:
         return dict(
@@ -105,6 +112,21 @@ def _extract_dfs(model, dict_out=False):
     else:
         return reg_df, error_df, total_df
 
+def _absorbed_sse(model):
+    ''' The sum of squared residuals of a model with only the absorbed effects of the given model,
+    which is the baseline of its global test.
+
+    Arguments:
+        model - A fitted Model object with absorbed effects.
+
+    Returns:
+        A real value indicating the sum of squared residuals.
+    '''
+    y = np.asarray(model.y_train_, dtype=float).reshape(-1, 1)
+    within, _ = _group_demean(y, _absorb_groups(model.training_data, model.absorb), model.weights_)
+    squares = within[:, 0] ** 2
+    return squares.sum() if model.weights_ is None else (model.weights_ * squares).sum()
+
 def _anova_terms(model):
     ''' Perform a global F-test by analyzing all possible models when you leave one coefficient out while fitting.
 
@@ -115,6 +137,8 @@ def _anova_terms(model):
         A DataFrame object that contains the degrees of freedom, adjusted sum of squares, 
         adjusted mean sum of squares, F values, and p values for the associated tests performed.
     '''
+    # Each term is tested by refitting without it
+    model._check_training_data()
     full_reg_df, full_error_df, total_df = _extract_dfs(model)
   
     # Full model values
@@ -122,7 +146,9 @@ def _anova_terms(model):
     full_ssr = model.get_ssr()  # sum of squares explained by model
     full_sst = model.get_sst()  
     
-    global_f_val, global_p_val = _calc_stats(full_ssr, full_reg_df, full_sse, full_error_df)
+    # The slopes explain what the absorbed effects leave over, rather than all of the SSR
+    global_ss = _absorbed_sse(model) - full_sse if model.absorb else full_ssr
+    global_f_val, global_p_val = _calc_stats(global_ss, full_reg_df, full_sse, full_error_df)
     
     # Calculate the general terms now
     indices = ["Global Test"]
@@ -160,6 +186,143 @@ def _anova_terms(model):
             "p" : p_vals
         }, index = indices, columns = ["DF", "SS Err.", "SS Reg.", "F", "p"])
 
+def _wald_test(model, columns):
+    ''' Wald F-test that the coefficients in columns are all zero, using the model's (possibly robust) covariance.
+
+    Arguments:
+        model - A fitted Model object.
+        columns - A list of coefficient names.
+
+    Returns:
+        A tuple containing the F statistic and its p-value.
+    '''
+    positions = model.coef_.index.get_indexer(columns)
+    coefs = model.coef_.values[positions]
+    cov = model.cov_[np.ix_(positions, positions)]
+    f_val = coefs @ np.linalg.solve(cov, coefs) / len(columns)
+    return f_val, f.sf(f_val, len(columns), model.rdf)
+
+def _wald_terms(model):
+    ''' Test the global null and each term's coefficients with Wald tests, for models with a robust covariance.
+    Unlike the sums of squares comparisons, this does not refit any models.
+
+    Arguments:
+        model - A fitted model object.
+
+    Returns:
+        A DataFrame object that contains the degrees of freedom, F values, and p values for the tests performed.
+    '''
+    slopes = [column for column in model.coef_.index if column != "Intercept" or not model.intercept]
+    tests = [("Global Test", slopes)]
+    for term in model.ex.get_terms():
+        columns = [name for name, func in term._compile()]
+        if len(columns) > 0:
+            tests.append(("- " + str(term), columns))
+
+    dfs, f_vals, p_vals = [], [], []
+    for label, columns in tests:
+        f_val, p_val = _wald_test(model, columns)
+        dfs.append(len(columns))
+        f_vals.append(f_val)
+        p_vals.append(p_val)
+
+    indices = [label for label, columns in tests] + ["Error"]
+    return pd.DataFrame({
+            "DF" : dfs + [model.rdf],
+            "F" : f_vals + [""],
+            "p" : p_vals + [""]
+        }, index = indices, columns = ["DF", "F", "p"])
+
+def _compare_models(full_model, reduced_model):
+    if isinstance(full_model, GeneralizedLinearModel):
+        return _deviance_models(full_model, reduced_model)
+    return _anova_models(full_model, reduced_model)
+
+def _deviance_stats(deviance, df, full_model):
+    ''' Test a drop in deviance. With a known dispersion (e.g., binomial, poisson) the drop is compared to a
+    chi-squared distribution, otherwise the drop per degree of freedom is scaled by the full model's estimated
+    dispersion and compared to an F distribution.
+
+    Arguments:
+        deviance - The increase in deviance from leaving coefficients out of the full model.
+        df - The number of coefficients left out.
+        full_model - A fitted GeneralizedLinearModel.
+
+    Returns:
+        A tuple containing the test statistic and its p-value.
+    '''
+    if full_model.family.fixed_scale:
+        return deviance, chi2.sf(deviance, df)
+    f_val = deviance / df / full_model.scale_
+    return f_val, f.sf(f_val, df, full_model.rdf)
+
+def _deviance_terms(model):
+    ''' Analysis of deviance for a GeneralizedLinearModel: the global test against the null model, and a test
+    for leaving out each term (refitting without it).
+
+    Arguments:
+        model - A fitted GeneralizedLinearModel.
+
+    Returns:
+        A DataFrame object that contains the degrees of freedom, deviances, test statistics (Chi2 or F), and p values.
+    '''
+    model._check_training_data()
+    statistic = "Chi2" if model.family.fixed_scale else "F"
+    reg_df = model.ex.get_dof()
+    global_stat, global_p = _deviance_stats(model.null_deviance_ - model.deviance_, reg_df, model)
+
+    indices = ["Global Test"]
+    dfs = [reg_df]
+    deviances = [model.null_deviance_]
+    stats = [global_stat]
+    p_vals = [global_p]
+
+    for term in model.ex.get_terms():
+        term_df = term.get_dof()
+        if term_df == 0:
+            continue
+        reduced_deviance, _ = _process_term(model, term)
+        term_stat, term_p = _deviance_stats(reduced_deviance - model.deviance_, term_df, model)
+        indices.append("- " + str(term))
+        dfs.append(term_df)
+        deviances.append(reduced_deviance)
+        stats.append(term_stat)
+        p_vals.append(term_p)
+
+    indices.append("Residual")
+    dfs.append(model.rdf)
+    deviances.append(model.deviance_)
+    stats.append("")
+    p_vals.append("")
+
+    return pd.DataFrame({
+            "DF" : dfs,
+            "Deviance" : deviances,
+            statistic : stats,
+            "p" : p_vals
+        }, index = indices, columns = ["DF", "Deviance", statistic, "p"])
+
+def _deviance_models(full_model, reduced_model):
+    ''' Compare nested GeneralizedLinearModels by the drop in deviance.
+
+    Arguments:
+        full_model - A fitted GeneralizedLinearModel.
+        reduced_model - A fitted GeneralizedLinearModel that is a subset of the full_model.
+
+    Returns:
+        A DataFrame object that contains the residual degrees of freedom and deviance of each model, 
+        the test statistic (Chi2 or F), and the p value.
+    '''
+    statistic = "Chi2" if full_model.family.fixed_scale else "F"
+    df = reduced_model.rdf - full_model.rdf
+    stat, p_val = _deviance_stats(reduced_model.deviance_ - full_model.deviance_, df, full_model)
+    return pd.DataFrame({
+        "DF" : [full_model.rdf, reduced_model.rdf],
+        "Deviance" : [full_model.deviance_, reduced_model.deviance_],
+        statistic : ["", stat],
+        "p" : ["", p_val]},
+        index = ["Full Model", "- Reduced Model"], columns = ["DF", "Deviance", statistic, "p"])
+
 def _anova_models(full_model, reduced_model):
     ''' Performs a partial F-test to compare two models.
 
@@ -174,6 +337,16 @@ def _anova_models(full_model, reduced_model):
     '''
     full_label = str(full_model)
     reduced_label = str(reduced_model)
+
+    if full_model.cov_type_ != "nonrobust":
+        # Test the extra coefficients of the full model with its robust covariance
+        columns = [column for column in full_model.coef_.index if column not in reduced_model.coef_.index]
+        f_val, p_val = _wald_test(full_model, columns)
+        return pd.DataFrame({
+            "DF" : [len(columns), full_model.rdf],
+            "F" : [f_val, ""],
+            "p" : [p_val, ""]},
+            index = ["- Reduced Model", "Error"], columns = ["DF", "F", "p"])
     
     f_reg_df, f_error_df, f_total_df = _extract_dfs(full_model)
     r_reg_df, r_error_df, r_total_df = _extract_dfs(reduced_model)
@@ -1,12 +1,15 @@
 import collections
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 from functools import reduce
 from itertools import product
 from abc import ABC, abstractmethod
 from scipy.special import binom
+from scipy import interpolate, sparse
 
 from . import transformation as _t 
+from .schema import Schema, _is_quantitative
 
 _supported_encodings = ['one-hot']
 
@@ -96,7 +99,7 @@ class Expression(ABC):
         be either a Quantitative or Categorical variable.
 
         Arguments:
-            data - A DataFrame object that contains a column == self.name
+            data - A DataFrame object that contains a column == self.name, or a Schema.
 
         Returns:
             A similar object that is either Quantitative or Categorical object.
@@ -149,7 +152,7 @@ class Expression(ABC):
                 return ret_exp
         elif isinstance(other, Combination):
             return other.__add__(self)
-        elif isinstance(other, (Var, TransVar, Constant, Interaction)):  # single term expressions
+        elif isinstance(other, (Var, TransVar, Constant, Interaction, Spline)):  # single term expressions
             return Combination((self, other))
         else:
             raise Exception("Expressions do not support addition with the given arguments.")
@@ -266,7 +269,7 @@ class Expression(ABC):
         ''' Given data, apply the appropriate transformations, combinations, and interactions.
 
         Arguments:
-            data - A DataFrame whose column names match the names of the base Variable objects.
+            data - A DataFrame (or salmon.sources.ColumnSource) whose column names match the names of the base Variable objects.
             fit - A flag to reference when evaluating the data to know when to overwrite Categorical levels.
         
         Returns:
@@ -274,6 +277,34 @@ class Expression(ABC):
         '''
         # Transform the incoming data depending on what type of variable the data is represented by
         pass
+
+    def _compile(self):
+        ''' Compile a fitted Expression into plain NumPy functions, so it can be evaluated without pandas.
+
+        Any learned state (Categorical levels, Transformation statistics) is captured at compile time.
+
+        Returns:
+            A list of (column name, function) pairs matching the columns produced by evaluate. Each function 
+            takes a mapping of variable names to arrays and returns an array (or a scalar to be broadcast).
+        '''
+        raise NotImplementedError("Compilation is not supported for " + type(self).__name__ + " objects.")
+
+    def _to_spec(self):
+        ''' Describe the Expression, including any learned state, as a JSON compatible dictionary.
+        The Expression can be rebuilt with expression._from_spec.
+        '''
+        raise NotImplementedError("Serialization is not supported for " + type(self).__name__ + " objects.")
+
+    def _to_source(self, names):
+        ''' Write a fitted Expression as NumPy source code.
+
+        Arguments:
+            names - A dictionary mapping ("Q" or "C", variable name) to the identifier holding that variable's array.
+
+        Returns:
+            A list of (column name, str of source code) pairs matching the columns produced by evaluate.
+        '''
+        raise NotImplementedError("Source generation is not supported for " + type(self).__name__ + " objects.")
     
     def reduce(self):
         ''' Obtain the base Quantitative, Categorical, Constant, and Varable terms. 
@@ -356,13 +387,27 @@ class Var(Expression):
         return Var(self.name, self.scale)
         
     def interpret(self, data):
-        if 'float' in data[self.name].dtype.name or 'int' in data[self.name].dtype.name:
+        if isinstance(data, Schema):
+            column = data[self.name]
+            if column.kind == "Q":
+                return Quantitative(self.name, self.scale)
+            return Categorical(self.name).interpret(data)
+        if _is_quantitative(data[self.name].dtype):
             return Quantitative(self.name, self.scale)
         else:
             return Categorical(self.name)
         
     def evaluate(self, data, fit = True):
         raise UnsupportedMethodException("Must call interpret prior to evaluating data for variables.")
+
+    def _compile(self):
+        raise Exception("Must call interpret prior to compiling variables.")
+
+    def _to_spec(self):
+        return {"type": "Var", "name": self.name, "scale": self.scale}
+
+    def _to_source(self, names):
+        raise Exception("Must call interpret prior to generating source code for variables.")
         
     def _reduce(self, ret_dict):
         ret_dict["V"].add(self)
@@ -433,11 +478,56 @@ class TransVar(Expression):
         self.var._descale()
         
     def evaluate(self, data, fit = True):
-        base_data = self.var.evaluate(data, fit)
-        base_data = base_data.sum(axis = 1)
-        transformed_data = self.scale * self.transformation.transform(values = base_data, training = fit)
-        transformed_data.name = str(self)
-        return pd.DataFrame(transformed_data)
+        # Nested transformations (e.g. log(x+1)^2) run as one chain of ufuncs, in place on a single column
+        chain = []
+        node = self
+        while isinstance(node, TransVar):
+            chain.append(node)
+            node = node.var
+        base_data = node.evaluate(data, fit)
+        # The only new column: the (sum of the) base columns, which every step then overwrites
+        values = np.array(base_data.iloc[:, 0], dtype = float)
+        for j in range(1, base_data.shape[1]):
+            values += base_data.iloc[:, j].to_numpy()
+
+        pending = []
+        for node in reversed(chain):
+            transformation = node.transformation
+            steps = transformation.steps()
+            if steps is None or (fit and transformation.stateful):
+                # Statistics (or an opaque function) need the whole column as it is at this point
+                _t._apply_inplace(values, pending)
+                pending = []
+                if steps is None:
+                    values[:] = transformation.transform(values = pd.Series(values, index = base_data.index), training = fit)
+                else:
+                    transformation.fit(values)
+                    pending.extend(transformation.steps())
+            else:
+                pending.extend(steps)
+            if node.scale != 1:
+                pending.append((np.multiply, node.scale))
+        _t._apply_inplace(values, pending)
+        return pd.DataFrame({str(self): values}, index = base_data.index)
+
+    def _compile(self):
+        inner = [func for _, func in self.var._compile()]
+        transformation, scale = self.transformation.copy(), self.scale
+
+        def func(columns):
+            return scale * transformation.transform(values = sum(f(columns) for f in inner), training = False)
+
+        return [(str(self), func)]
+
+    def _to_spec(self):
+        return {"type": "TransVar", "var": self.var._to_spec(), "transformation": self.transformation._to_spec(), "scale": self.scale}
+
+    def _to_source(self, names):
+        inner = " + ".join(source for _, source in self.var._to_source(names))
+        source = self.transformation._to_source(inner)
+        if self.scale != 1:
+            source = "{!r} * {}".format(self.scale, source)
+        return [(str(self), source)]
     
     def _reduce(self, ret_dict):
         return self.var._reduce(ret_dict)
@@ -490,6 +580,9 @@ class PowerVar(TransVar):
     
     def copy(self):
         return PowerVar(self.var, self.power, self.scale)
+
+    def _to_spec(self):
+        return {"type": "PowerVar", "var": self.var._to_spec(), "power": self.power, "scale": self.scale}
     
     def __hash__(self):
         return hash((self.var, self.scale, self.transformation, self.power))
@@ -573,6 +666,19 @@ class Quantitative(Var):
         transformed_data = self.scale * data[self.name]
         transformed_data.name = str(self)
         return pd.DataFrame(transformed_data)
+
+    def _compile(self):
+        name, scale = self.name, self.scale
+        return [(str(self), lambda columns: scale * columns[name])]
+
+    def _to_spec(self):
+        return {"type": "Quantitative", "name": self.name, "scale": self.scale}
+
+    def _to_source(self, names):
+        source = names[("Q", self.name)]
+        if self.scale != 1:
+            source = "{!r} * {}".format(self.scale, source)
+        return [(str(self), source)]
     
     def _reduce(self, ret_dict):
         ret_dict["Q"].add(self)
@@ -635,6 +741,22 @@ class Constant(Expression):
         else:
             transformed_data = pd.DataFrame(pd.Series(self.scale, data.index, name = str(self)))
             return transformed_data
+
+    def _compile(self):
+        if self.scale == 0:
+            return []
+        else:
+            scale = self.scale
+            return [(str(self), lambda columns: scale)]
+
+    def _to_spec(self):
+        return {"type": "Constant", "scale": self.scale}
+
+    def _to_source(self, names):
+        if self.scale == 0:
+            return []
+        else:
+            return [(str(self), repr(self.scale))]
         
     def _reduce(self, ret_dict):
         ret_dict['Constant'] = self.scale
@@ -681,6 +803,12 @@ class Categorical(Var):
         return Categorical(self.name, self.encoding, None if self.levels is None else self.levels[:], self.baseline)
                 
     def interpret(self, data):
+        # Levels that are not given take the schema's, so models fit with one schema share an encoding
+        if isinstance(data, Schema) and self.levels is None and data[self.name].levels is not None:
+            column = data[self.name]
+            self.levels = list(column.levels)
+            if self.baseline is None:
+                self.baseline = list(column.baseline)
         return self
     
     #def transform(self, transformation):
@@ -693,7 +821,8 @@ class Categorical(Var):
             self.baseline = [value]
         
     def _set_levels(self, data, override_baseline = True):
-        unique_values = data[self.name].unique()
+        # np.asarray also turns the unique values of category columns into a plain array
+        unique_values = np.asarray(data[self.name].unique())
         unique_values.sort()
         if self.levels is None:
             self.levels = unique_values[:]
@@ -716,12 +845,39 @@ class Categorical(Var):
         
     def evaluate(self, data, fit = True):
         if self.levels is None or self.baseline is None:
+            if not fit:
+                # Learning levels from new data would change what earlier predictions meant
+                raise Exception("Levels for " + self.name + " must be learned by fitting prior to evaluating new data.")
             self._set_levels(data)
         
         if self.encoding == 'one-hot':
             return self._one_hot_encode(data)
         else:
             raise NotImplementedException()
+
+    def _compile(self):
+        if self.levels is None or self.baseline is None:
+            raise Exception("Levels for " + self.name + " must be learned by fitting prior to compiling.")
+
+        def indicator(name, level):
+            return lambda columns: (columns[name] == level) * 1.0
+
+        return [(self.name + "{" + str(level) + "}", indicator(self.name, level)) for level in self.levels if level not in self.baseline]
+
+    def _to_spec(self):
+        return {
+            "type": "Categorical",
+            "name": self.name,
+            "encoding": self.encoding,
+            "levels": None if self.levels is None else [_json_value(level) for level in self.levels],
+            "baseline": None if self.baseline is None else [_json_value(level) for level in self.baseline]
+        }
+
+    def _to_source(self, names):
+        if self.levels is None or self.baseline is None:
+            raise Exception("Levels for " + self.name + " must be learned by fitting prior to generating source code.")
+        return [(self.name + "{" + str(level) + "}", "({} == {!r})".format(names[("C", self.name)], _json_value(level)))
+                for level in self.levels if level not in self.baseline]
         
     def _reduce(self, ret_dict):
         ret_dict["C"].add(self)
@@ -834,21 +990,42 @@ class Interaction(Expression):
         for term in self.terms:
             term._descale()
             
+    def _sorted_terms(self):
+        ''' The terms in a deterministic order, so column names do not depend on set iteration order. '''
+        return sorted(self.terms, key = str)
+
     def evaluate(self, data, fit = True):
-        transformed_data_sets = [var.evaluate(data, fit) for var in self.terms]
-        # rename columns in sets
-        for data_set in transformed_data_sets:
-            data_set.columns = ["({})".format(col) for col in data_set.columns]
-            
-        base_set = transformed_data_sets[0]
+        transformed_data_sets = [var.evaluate(data, fit) for var in self._sorted_terms()]
+        # Build the product column names without renaming the terms' DataFrames
+        base_set = [("({})".format(col), values) for col, values in transformed_data_sets[0].items()]
         for data_set in transformed_data_sets[1:]:
-            new_set = pd.DataFrame()
-            for base_column in base_set:
-                for new_column in data_set:
-                    new_set[base_column + new_column] = base_set[base_column] * data_set[new_column]
-            
-            base_set = new_set
-            
+            base_set = [(base_column + "({})".format(new_column), base_values * new_values)
+                        for base_column, base_values in base_set for new_column, new_values in data_set.items()]
+
+        return pd.DataFrame(OrderedDict(base_set), index = transformed_data_sets[0].index)
+
+    def _compile(self):
+        def product(left, right):
+            return lambda columns: left(columns) * right(columns)
+
+        compiled_sets = [var._compile() for var in self._sorted_terms()]
+        base_set = [("({})".format(name), func) for name, func in compiled_sets[0]]
+        for compiled_set in compiled_sets[1:]:
+            base_set = [(base_name + "({})".format(new_name), product(base_func, new_func))
+                        for base_name, base_func in base_set for new_name, new_func in compiled_set]
+
+        return base_set
+
+    def _to_spec(self):
+        return {"type": "Interaction", "terms": [term._to_spec() for term in self._sorted_terms()], "scale": self.scale}
+
+    def _to_source(self, names):
+        source_sets = [var._to_source(names) for var in self._sorted_terms()]
+        base_set = [("({})".format(name), source) for name, source in source_sets[0]]
+        for source_set in source_sets[1:]:
+            base_set = [(base_name + "({})".format(new_name), base_source + " * " + new_source)
+                        for base_name, base_source in base_set for new_name, new_source in source_set]
+
         return base_set
     
     def _reduce(self, ret_dict):
@@ -1020,6 +1197,15 @@ class Combination(Expression):
             
     def evaluate(self, data, fit = True):
         return pd.concat([term.evaluate(data, fit) for term in self.terms], axis = 1)
+
+    def _compile(self):
+        return [column for term in self.terms for column in term._compile()]
+
+    def _to_spec(self):
+        return {"type": "Combination", "terms": [term._to_spec() for term in self.terms], "scale": self.scale}
+
+    def _to_source(self, names):
+        return [column for term in self.terms for column in term._to_source(names)]
     
     def _reduce(self, ret_dict):
         for term in self.terms:
@@ -1045,6 +1231,348 @@ class Combination(Expression):
                     return True
         return False
     
+def _bspline_band(x, knots, degree):
+    ''' Evaluate a B-spline basis, vectorized over x. np.searchsorted finds the knot span of every value and 
+    the Cox-de Boor recursion builds the degree + 1 basis functions that are nonzero on that span. Values 
+    outside the knots use the first or last span, extending its polynomial piece.
+
+    Returns:
+        A tuple of an (n x (degree + 1)) array of the nonzero values of each row, and an (n,) array of the 
+        index of each row's first nonzero basis function. Row i is nonzero in columns first[i] to first[i] + degree.
+    '''
+    x = np.atleast_1d(np.asarray(x, dtype = float))
+    knots = np.asarray(knots, dtype = float)
+    n, n_basis = len(x), len(knots) - degree - 1
+    span = np.clip(np.searchsorted(knots, x, side = "right") - 1, degree, n_basis - 1)
+    values = np.zeros((n, degree + 1))
+    values[:, 0] = 1
+    left = np.empty((n, degree + 1))
+    right = np.empty((n, degree + 1))
+    for j in range(1, degree + 1):
+        left[:, j] = x - knots[span + 1 - j]
+        right[:, j] = knots[span + j] - x
+        saved = np.zeros(n)
+        for r in range(j):
+            temp = values[:, r] / (right[:, r + 1] + left[:, j - r])
+            values[:, r] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+        values[:, j] = saved
+    return values, span - degree
+
+def _spline_band(x, knots, degree, tails = None):
+    ''' Like _bspline_band, but with tails = (lower, upper, lower slopes, upper slopes) the basis is extended 
+    linearly past the boundary knots, with the given slopes of the first and last degree + 1 basis functions. '''
+    if tails is None:
+        return _bspline_band(x, knots, degree)
+    x = np.atleast_1d(np.asarray(x, dtype = float))
+    lower, upper, lower_slopes, upper_slopes = tails
+    values, first = _bspline_band(np.clip(x, lower, upper), knots, degree)
+    values += np.outer(np.minimum(x - lower, 0), lower_slopes) + np.outer(np.maximum(x - upper, 0), upper_slopes)
+    return values, first
+
+def _spline_basis(x, knots, degree, transform, tails = None):
+    ''' The dense (n x df) spline basis: the B-spline basis (see _spline_band) times a (basis functions x df) 
+    transform. Only needs NumPy, so it is also written into generated scoring code. '''
+    values, first = _spline_band(x, knots, degree, tails)
+    transform = np.asarray(transform, dtype = float)
+    basis = np.zeros((len(first), transform.shape[0]))
+    basis[np.arange(len(first))[:, np.newaxis], first[:, np.newaxis] + np.arange(degree + 1)] = values
+    return basis @ transform
+
+class Spline(Expression):
+    ''' A smooth function of a single quantitative Expression, modeled by a spline basis. Each basis column 
+    is only nonzero between a few neighboring knots, so the basis is a banded sparse block that stays well 
+    conditioned, unlike the power columns of Poly.
+
+    Knots that are not given are learned when fitting (at quantiles of the training values, between their
+    minimum and maximum) and are then kept for predictions, like the levels of a Categorical.
+    '''
+
+    prefix = None
+
+    def __init__(self, var, df = None, knots = None, bounds = None, scale = 1):
+        ''' Create a Spline object (only possible through inheritance).
+
+        Arguments:
+            var - An Expression (or str name of a Quantitative variable) to take a smooth function of.
+            df - An int number of basis columns. Interior knots are placed at evenly spaced quantiles.
+            knots - An optional list of interior knots, instead of df.
+            bounds - An optional (lower, upper) tuple of boundary knots. Default is the range of the training values.
+            scale - A real value that will multiplicatively scale the term.
+        '''
+        if df is None and knots is None:
+            raise Exception("A spline needs either df or knots.")
+        self.var = Quantitative(var) if isinstance(var, str) else var
+        self.df = df
+        self.knots = None if knots is None else sorted(knots)
+        self.bounds = None if bounds is None else tuple(bounds)
+        self.scale = scale
+        # Learned (or given) knots used for evaluation
+        self.knots_, self.bounds_ = None, None
+        if self.knots is not None and self.bounds is not None:
+            self.knots_, self.bounds_ = list(self.knots), self.bounds
+
+    def _options(self):
+        return (self.df, None if self.knots is None else tuple(self.knots), self.bounds)
+
+    def __str__(self):
+        options = "df={}".format(self.df) if self.knots is None else "knots={}".format(self.knots)
+        base = "{}({}, {})".format(self.prefix, self.var, options)
+        if self.scale == 1:
+            return base
+        else:
+            return "{}*{}".format(self.scale, base)
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self.var == other.var and self._options() == other._options() and self.scale == other.scale
+        return False
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.var, self._options(), self.scale))
+
+    def _copy_state(self, other):
+        other.knots_ = None if self.knots_ is None else list(self.knots_)
+        other.bounds_ = self.bounds_
+        return other
+
+    def __pow__(self, other):
+        raise Exception("Splines cannot be raised to a power. Use a larger df instead.")
+
+    def interpret(self, data):
+        self.var = self.var.interpret(data)
+        return self
+
+    def _descale(self):
+        self.scale = 1
+        self.var._descale()
+
+    @abstractmethod
+    def _interior_count(self):
+        ''' The number of interior knots that give df columns. '''
+        pass
+
+    def _learn_knots(self, x):
+        if self.bounds is None:
+            lower, upper = np.nanmin(x), np.nanmax(x)
+        else:
+            lower, upper = self.bounds
+        if not lower < upper:
+            raise Exception("The boundary knots of " + str(self) + " must span a range of values.")
+        if self.knots is None:
+            count = self._interior_count()
+            if count < 0:
+                raise Exception("df is too small for " + str(self) + ".")
+            knots = np.unique(np.nanquantile(x, np.linspace(0, 1, count + 2)[1:-1]))
+            # Ties (e.g. at the boundary) would give empty spans
+            knots = knots[(knots > lower) & (knots < upper)]
+        else:
+            knots = np.asarray(self.knots, dtype = float)
+        self.knots_, self.bounds_ = [float(knot) for knot in knots], (float(lower), float(upper))
+
+    def _knot_vector(self, degree):
+        lower, upper = self.bounds_
+        return np.concatenate([np.repeat(lower, degree + 1), self.knots_, np.repeat(upper, degree + 1)])
+
+    @abstractmethod
+    def _setup(self):
+        ''' The (knots, degree, transform, tails) describing the basis. See _spline_basis. '''
+        pass
+
+    def _check_knots(self, action):
+        if self.knots_ is None:
+            raise Exception("Knots for " + str(self) + " must be learned by fitting prior to " + action + ".")
+
+    def _columns(self):
+        return [str(self) + "{" + str(j) + "}" for j in range(1, self.get_dof() + 1)]
+
+    def _values(self, data, fit):
+        base_data = self.var.evaluate(data, fit)
+        values = np.array(base_data.iloc[:, 0], dtype = float)
+        for j in range(1, base_data.shape[1]):
+            values += base_data.iloc[:, j].to_numpy()
+        return values, base_data.index
+
+    def _sparse(self, values):
+        knots, degree, transform, tails = self._setup()
+        band, first = _spline_band(values, knots, degree, tails)
+        n, width = band.shape
+        block = sparse.csr_matrix((band.ravel(), (first[:, np.newaxis] + np.arange(width)).ravel(), np.arange(0, n * width + 1, width)),
+                                  shape = (n, transform.shape[0]))
+        return self.scale * (block @ sparse.csr_matrix(transform))
+
+    def sparse_basis(self, data):
+        ''' Evaluate the basis on new data as a scipy sparse (CSR) matrix, without densifying it.
+
+        Arguments:
+            data - A DataFrame containing the variable.
+
+        Returns:
+            An (n x df) scipy.sparse.csr_matrix with at most a few nonzero entries per row.
+        '''
+        self._check_knots("evaluating new data")
+        values, _ = self._values(data, fit = False)
+        return self._sparse(values)
+
+    def evaluate(self, data, fit = True):
+        ''' Evaluate the basis as a dense DataFrame, like every other Expression, so it can be combined and
+        interacted with them in a model's design. Use sparse_basis for the banded sparse block itself. '''
+        values, index = self._values(data, fit)
+        if self.knots_ is None:
+            if not fit:
+                self._check_knots("evaluating new data")
+            self._learn_knots(values)
+        return pd.DataFrame(self._sparse(values).toarray(), columns = self._columns(), index = index)
+
+    def _compile(self):
+        self._check_knots("compiling")
+        inner = [func for _, func in self.var._compile()]
+        knots, degree, transform, tails = self._setup()
+        scale = self.scale
+        # Every column of a row needs the same basis, so the last one is kept (as a pair, so threads never mix them)
+        last = [(None, None)]
+
+        def basis(columns):
+            cached_columns, cached_basis = last[0]
+            if cached_columns is not columns:
+                cached_basis = scale * _spline_basis(sum(f(columns) for f in inner), knots, degree, transform, tails)
+                last[0] = (columns, cached_basis)
+            return cached_basis
+
+        def column(j):
+            return lambda columns: basis(columns)[:, j]
+
+        return [(name, column(j)) for j, name in enumerate(self._columns())]
+
+    def _to_source(self, names):
+        self._check_knots("generating source code")
+        inner = " + ".join(source for _, source in self.var._to_source(names))
+        knots, degree, transform, tails = self._setup()
+        if tails is not None:
+            tails = (tails[0], tails[1], tails[2].tolist(), tails[3].tolist())
+        source = "_spline_basis({}, {!r}, {!r}, {!r}, {!r})".format(inner, knots.tolist(), degree, transform.tolist(), tails)
+        if self.scale != 1:
+            source = "{!r} * {}".format(self.scale, source)
+        return [(name, "{}[:, {}]".format(source, j)) for j, name in enumerate(self._columns())]
+
+    def _spec_options(self):
+        return {
+            "var": self.var._to_spec(),
+            "df": self.df,
+            "knots": self.knots,
+            "bounds": None if self.bounds is None else list(self.bounds),
+            "scale": self.scale,
+            "learned_knots": self.knots_,
+            "learned_bounds": None if self.bounds_ is None else list(self.bounds_)
+        }
+
+    def _reduce(self, ret_dict):
+        return self.var._reduce(ret_dict)
+
+    def get_terms(self):
+        return [self]
+
+    def contains(self, other):
+        if isinstance(other, Combination):
+            return any(self.contains(other_term) for other_term in other.terms)
+
+        return self.var.__eq__(other) or self.var.contains(other)
+
+class BSpline(Spline):
+    ''' A B-spline basis of a given degree (cubic by default). Outside the boundary knots the polynomial 
+    pieces of the outermost spans are extended. '''
+
+    prefix = "bs"
+
+    def __init__(self, var, df = None, knots = None, degree = 3, bounds = None, scale = 1):
+        ''' Create a BSpline object.
+
+        Arguments:
+            var - An Expression (or str name of a Quantitative variable) to take a smooth function of.
+            df - An int number of basis columns, at least degree. There are df - degree interior knots.
+            knots - An optional list of interior knots, instead of df.
+            degree - An int polynomial degree of the pieces. Default is 3 (cubic).
+            bounds - An optional (lower, upper) tuple of boundary knots. Default is the range of the training values.
+            scale - A real value that will multiplicatively scale the term.
+        '''
+        self.degree = degree
+        super().__init__(var, df, knots, bounds, scale)
+
+    def _options(self):
+        return super()._options() + (self.degree,)
+
+    def copy(self):
+        return self._copy_state(BSpline(self.var.copy(), self.df, self.knots, self.degree, self.bounds, self.scale))
+
+    def _interior_count(self):
+        return self.df - self.degree
+
+    def _setup(self):
+        knots = self._knot_vector(self.degree)
+        # The first basis function is dropped, as the basis functions sum to the intercept
+        transform = np.eye(len(knots) - self.degree - 1)[:, 1:]
+        return knots, self.degree, transform, None
+
+    def _to_spec(self):
+        spec = self._spec_options()
+        spec.update(type = "BSpline", degree = self.degree)
+        return spec
+
+    def get_dof(self):
+        if self.knots_ is not None:
+            return len(self.knots_) + self.degree
+        return self.df if self.knots is None else len(self.knots) + self.degree
+
+class NaturalSpline(Spline):
+    ''' A natural cubic spline basis: cubic between the knots and linear outside of the boundary knots,
+    which keeps the fit stable near (and past) the ends of the data. '''
+
+    prefix = "ns"
+
+    def __init__(self, var, df = None, knots = None, bounds = None, scale = 1):
+        ''' Create a NaturalSpline object.
+
+        Arguments:
+            var - An Expression (or str name of a Quantitative variable) to take a smooth function of.
+            df - An int number of basis columns, at least 1. There are df - 1 interior knots.
+            knots - An optional list of interior knots, instead of df.
+            bounds - An optional (lower, upper) tuple of boundary knots. Default is the range of the training values.
+            scale - A real value that will multiplicatively scale the term.
+        '''
+        super().__init__(var, df, knots, bounds, scale)
+
+    def copy(self):
+        return self._copy_state(NaturalSpline(self.var.copy(), self.df, self.knots, self.bounds, self.scale))
+
+    def _interior_count(self):
+        return self.df - 1
+
+    def _setup(self):
+        knots = self._knot_vector(3)
+        lower, upper = self.bounds_
+        m = len(knots) - 4
+        curve = interpolate.BSpline(knots, np.eye(m), 3)
+        # Zero second derivatives at both boundary knots. Each constraint is solved for one pivot basis function
+        # near its boundary, so every column still only mixes a few neighboring basis functions (and the first 
+        # basis function is dropped for the intercept, as for BSpline).
+        constraints = np.vstack([curve(lower, 2), curve(upper, 2)])
+        pivots, rest = [1, m - 1], list(range(2, m - 1))
+        transform = np.zeros((m, len(rest)))
+        transform[rest, np.arange(len(rest))] = 1
+        transform[pivots, :] = -np.linalg.solve(constraints[:, pivots], constraints[:, rest])
+        tails = (lower, upper, curve(lower, 1)[:4], curve(upper, 1)[-4:])
+        return knots, 3, transform, tails
+
+    def _to_spec(self):
+        spec = self._spec_options()
+        spec.update(type = "NaturalSpline")
+        return spec
+
+    def get_dof(self):
+        if self.knots_ is not None:
+            return len(self.knots_) + 1
+        return self.df if self.knots is None else len(self.knots) + 1
+
 def MultinomialCoef(params):
     ''' Calculate the coefficients necessary when raising polynomials to a power.
 
@@ -1104,6 +1632,49 @@ def Poly(var, power):
         return reduce(lambda x,y: x + y, terms)
            
         
+def _json_value(value):
+    ''' Convert NumPy scalars (e.g. learned Categorical levels) into plain Python values for JSON. '''
+    return value.item() if isinstance(value, np.generic) else value
+
+def _from_spec(spec):
+    ''' Rebuild an Expression from the dictionary produced by Expression._to_spec.
+
+    Arguments:
+        spec - A dictionary describing an Expression.
+
+    Returns:
+        An Expression object with any learned state restored.
+    '''
+    kind = spec["type"]
+    if kind == "Var":
+        return Var(spec["name"], spec["scale"])
+    elif kind == "Quantitative":
+        return Quantitative(spec["name"], spec["scale"])
+    elif kind == "Categorical":
+        return Categorical(spec["name"], spec["encoding"], spec["levels"], spec["baseline"])
+    elif kind == "Constant":
+        return Constant(spec["scale"])
+    elif kind == "PowerVar":
+        return PowerVar(_from_spec(spec["var"]), spec["power"], spec["scale"])
+    elif kind == "TransVar":
+        return TransVar(_from_spec(spec["var"]), _t._from_spec(spec["transformation"]), spec["scale"])
+    elif kind == "Interaction":
+        return Interaction([_from_spec(term) for term in spec["terms"]], spec["scale"])
+    elif kind == "Combination":
+        return Combination([_from_spec(term) for term in spec["terms"]], spec["scale"])
+    elif kind in ("BSpline", "NaturalSpline"):
+        options = dict(df = spec["df"], knots = spec["knots"], bounds = spec["bounds"], scale = spec["scale"])
+        if kind == "BSpline":
+            spline = BSpline(_from_spec(spec["var"]), degree = spec["degree"], **options)
+        else:
+            spline = NaturalSpline(_from_spec(spec["var"]), **options)
+        if spec["learned_knots"] is not None:
+            spline.knots_, spline.bounds_ = list(spec["learned_knots"]), tuple(spec["learned_bounds"])
+        return spline
+    else:
+        raise Exception("Unknown Expression type " + str(kind) + ".")
+           
+        
 # Transformations 
 Log = lambda var: var.transform("log")
 Log10 = lambda var: var.transform("log10")
@@ -1124,4 +1695,6 @@ C = Categorical
 Cat = Categorical
 Nominal = Categorical
 Nom = Categorical
-N = Categorical
\ No newline at end of file
+N = Categorical
+BS = BSpline
+NS = NaturalSpline
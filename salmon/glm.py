@@ -0,0 +1,403 @@
+import numpy as np
+
+import scipy.stats as stats
+from scipy.special import expit, logit, xlogy, gammaln
+
+import pandas as pd
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from .model import LinearModel, _confint, _t_crit, _resolve_weights
+from .solvers import cho_inv, _solve
+from .sources import as_source
+
+
+class Family(ABC):
+    ''' A distribution of the response (and its link function) for a GeneralizedLinearModel. '''
+
+    name = None
+
+    # Whether the dispersion is known to be 1 (True) or estimated from the data (False)
+    fixed_scale = False
+
+    @abstractmethod
+    def link(self, mu):
+        pass
+
+    @abstractmethod
+    def inverse_link(self, eta):
+        pass
+
+    @abstractmethod
+    def mu_eta(self, eta):
+        ''' The derivative of the mean with respect to the linear predictor. '''
+        pass
+
+    @abstractmethod
+    def variance(self, mu):
+        pass
+
+    @abstractmethod
+    def unit_deviance(self, y, mu):
+        pass
+
+    @abstractmethod
+    def log_likelihood(self, y, mu, scale, weights):
+        pass
+
+    def initialize(self, y):
+        ''' Starting values for the mean, which must be valid for the link. '''
+        return y.astype(float)
+
+    def deviance(self, y, mu, weights):
+        return (weights * self.unit_deviance(y, mu)).sum()
+
+    def __str__(self):
+        return self.name
+
+
+class Gaussian(Family):
+    ''' Normal response with the identity link. Equivalent to a LinearModel. '''
+
+    name = "gaussian"
+
+    def link(self, mu):
+        return mu
+
+    def inverse_link(self, eta):
+        return eta
+
+    def mu_eta(self, eta):
+        return np.ones_like(eta)
+
+    def variance(self, mu):
+        return np.ones_like(mu)
+
+    def unit_deviance(self, y, mu):
+        return (y - mu) ** 2
+
+    def log_likelihood(self, y, mu, scale, weights):
+        return (-0.5 * (weights * (y - mu) ** 2 / scale + np.log(2 * np.pi * scale / weights))).sum()
+
+
+class Binomial(Family):
+    ''' Binary (or proportion) response with the logit link. '''
+
+    name = "binomial"
+    fixed_scale = True
+
+    def link(self, mu):
+        return logit(mu)
+
+    def inverse_link(self, eta):
+        return expit(eta)
+
+    def mu_eta(self, eta):
+        mu = expit(eta)
+        return np.maximum(mu * (1 - mu), np.finfo(float).eps)
+
+    def variance(self, mu):
+        return np.maximum(mu * (1 - mu), np.finfo(float).eps)
+
+    def unit_deviance(self, y, mu):
+        return 2 * (xlogy(y, y / mu) + xlogy(1 - y, (1 - y) / (1 - mu)))
+
+    def log_likelihood(self, y, mu, scale, weights):
+        return (weights * (xlogy(y, mu) + xlogy(1 - y, 1 - mu))).sum()
+
+    def initialize(self, y):
+        if ((y < 0) | (y > 1)).any():
+            raise Exception("The response of a binomial model must be between 0 and 1.")
+        return (y + 0.5) / 2
+
+
+class Poisson(Family):
+    ''' Count response with the log link. '''
+
+    name = "poisson"
+    fixed_scale = True
+
+    def link(self, mu):
+        return np.log(mu)
+
+    def inverse_link(self, eta):
+        return np.exp(eta)
+
+    def mu_eta(self, eta):
+        return np.maximum(np.exp(eta), np.finfo(float).eps)
+
+    def variance(self, mu):
+        return mu
+
+    def unit_deviance(self, y, mu):
+        return 2 * (xlogy(y, y / mu) - (y - mu))
+
+    def log_likelihood(self, y, mu, scale, weights):
+        return (weights * (xlogy(y, mu) - mu - gammaln(y + 1))).sum()
+
+    def initialize(self, y):
+        if (y < 0).any():
+            raise Exception("The response of a poisson model must be non-negative.")
+        return y + 0.1
+
+
+class Gamma(Family):
+    ''' Positive, right skewed response with the log link. '''
+
+    name = "gamma"
+
+    def link(self, mu):
+        return np.log(mu)
+
+    def inverse_link(self, eta):
+        return np.exp(eta)
+
+    def mu_eta(self, eta):
+        return np.maximum(np.exp(eta), np.finfo(float).eps)
+
+    def variance(self, mu):
+        return mu ** 2
+
+    def unit_deviance(self, y, mu):
+        return 2 * (-np.log(y / mu) + (y - mu) / mu)
+
+    def log_likelihood(self, y, mu, scale, weights):
+        shape = weights / scale
+        return (shape * np.log(shape * y / mu) - shape * y / mu - np.log(y) - gammaln(shape)).sum()
+
+    def initialize(self, y):
+        if (y <= 0).any():
+            raise Exception("The response of a gamma model must be positive.")
+        return y.astype(float)
+
+
+_families = dict(
+    gaussian=Gaussian,
+    binomial=Binomial,
+    poisson=Poisson,
+    gamma=Gamma,
+)
+
+
+class GeneralizedLinearModel(LinearModel):
+    ''' A Model where a link function of the mean response is linearly related to the explanatory variables,
+    and the response follows a distribution from an exponential family.
+
+    Fitting uses iteratively reweighted least squares: the design is evaluated once, and each iteration
+    solves a weighted least squares problem (with the solver backends of LinearModel) warm started from
+    the previous iteration's linear predictor.
+    '''
+
+    def __init__(self, explanatory, response, family="gaussian", intercept=True, retain="all"):
+        ''' Create a GeneralizedLinearModel object.
+
+        Arguments:
+            explanatory - An Expression that is either a single term or a Combination of terms. These are the X's.
+            response - An Expression that represents the single term for the response variable.
+            family - A str naming the response distribution ("gaussian", "binomial", "poisson", "gamma"), or a Family object.
+                The gaussian family uses the identity link, binomial the logit link, and poisson and gamma the log link.
+            intercept - A boolean indicating whether an intercept should be included (True) or not (False).
+            retain - A str controlling which training artifacts are kept after fitting. See LinearModel.
+        '''
+        super(GeneralizedLinearModel, self).__init__(explanatory, response, intercept=intercept, retain=retain)
+        if isinstance(family, str):
+            if family not in _families:
+                raise KeyError("Family '{}' not supported. The following families are supported: {}".format(
+                    family,
+                    list(_families.keys())
+                ))
+            family = _families[family]()
+        self.family = family
+
+    def __str__(self):
+        return super(GeneralizedLinearModel, self).__str__() + " [" + str(self.family) + "]"
+
+    def _submodel(self, explanatory, response=None):
+        model = GeneralizedLinearModel(explanatory, self.given_re if response is None else response,
+                                       family=self.family, intercept=self.intercept)
+        model.schema = self.schema
+        return model
+
+    def _check_supported(self, feature, allow_weights=False):
+        raise Exception("GeneralizedLinearModels do not support {}.".format(feature))
+
+    @property
+    def _inference_df(self):
+        # Wald tests are z tests when the dispersion is known
+        return np.inf if self.family.fixed_scale else self.rdf
+
+    def fit(self, X, y=None, solver="auto", max_iter=25, tol=1e-8, weights=None, na_action="drop",
+            schema=None):
+        ''' Fit a GeneralizedLinearModel to data.
+
+        Arguments:
+            X - A DataFrame (or column source, see LinearModel.fit) containing all of the explanatory 
+                variables in the model and possibly the response variable too.
+            y - An optional Series that contains the response variable.
+            solver - The least squares backend used for each iteration. See LinearModel.fit.
+            max_iter - An int maximum number of iterations.
+            tol - A float tolerance on the relative change in deviance between iterations.
+            weights - An optional str name of a column (or an array) of positive prior weights for each row.
+            na_action - A str, either "drop" (default) or "raise". See LinearModel.fit.
+            schema - An optional Schema to interpret the variables with. See LinearModel.fit.
+
+        Returns:
+            A DataFrame containing relevant statistics of fitted Model (e.g., coefficients, p-values).
+        '''
+        X = self._read_columns(X, weights)
+        if y is None:
+            data = X
+        else:
+            data = pd.concat([X, y], axis = 1)
+        data, weights, _ = self._drop_missing(data, na_action, weights)
+        if weights is not None:
+            weights = _resolve_weights(data, weights)
+        self.schema = schema
+        return self._fit(data, solver=solver, weights=weights, max_iter=max_iter, tol=tol)
+
+    def _fit(self, data, solver="auto", weights=None, max_iter=25, tol=1e-8, **kwargs):
+        X, y = self._evaluate_training(data)
+        self.n, self.p = X.shape
+        X_values, y_values = X.to_numpy(dtype=float), y.to_numpy(dtype=float)
+        prior = np.ones(self.n) if weights is None else np.asarray(weights, dtype=float)
+        self.weights_ = None if weights is None else prior
+        family = self.family
+
+        mu = family.initialize(y_values)
+        eta = family.link(mu)
+        deviance = np.inf
+        self.converged_ = False
+        for iteration in range(1, max_iter + 1):
+            # Working weights and response for this iteration
+            mu_eta = family.mu_eta(eta)
+            working_weights = prior * mu_eta ** 2 / family.variance(mu)
+            z = eta + (y_values - mu) / mu_eta
+
+            if self.intercept:
+                total = working_weights.sum()
+                X_offsets = working_weights @ X_values / total
+                z_offset = working_weights @ z / total
+            else:
+                X_offsets, z_offset = np.zeros(self.p), 0.0
+            root_weights = np.sqrt(working_weights)
+            backend, coef, r, q = _solve(root_weights[:, np.newaxis] * (X_values - X_offsets),
+                                         root_weights * (z - z_offset), np.zeros(self.p), solver)
+
+            eta = z_offset + X_values @ coef - X_offsets @ coef
+            mu = family.inverse_link(eta)
+            new_deviance = family.deviance(y_values, mu, prior)
+            change = abs(new_deviance - deviance) / (abs(new_deviance) + 0.1)
+            deviance = new_deviance
+            if change < tol:
+                self.converged_ = True
+                break
+        self.iterations_ = iteration
+        self.solver_, self.approximate_ = backend.name, backend.approximate
+
+        # Keep what prediction intervals need, in the same form as LinearModel
+        self.r_ = r
+        self.X_offsets_ = X_offsets
+        self.y_offset_ = z_offset
+        self.total_weight_ = working_weights.sum()
+
+        # Null model: the (weighted) mean response if there is an intercept
+        null_mu = np.full(self.n, np.average(y_values, weights=prior) if self.intercept else family.inverse_link(0.0))
+        self.deviance_ = deviance
+        self.null_deviance_ = family.deviance(y_values, null_mu, prior)
+        self.sse_, self.sst_ = self.deviance_, self.null_deviance_
+
+        self.rdf = self.n - self.p - (1 if self.intercept else 0)
+        if family.fixed_scale:
+            self.scale_ = 1.0
+        else:
+            self.scale_ = (prior * (y_values - mu) ** 2 / family.variance(mu)).sum() / self.rdf
+        self.resid_var_ = self.scale_
+        self.log_likelihood_ = family.log_likelihood(y_values, mu, self.scale_, prior)
+
+        fitted = pd.Series(mu, index=y.index)
+        self._retain_artifacts(X, y, fitted, y - fitted, None)
+
+        # Covariance of the coefficients, with the intercept last
+        cols = list(X.columns)
+        self.cov_ = self.scale_ * cho_inv(r)
+        if self.intercept:
+            cols.append("Intercept")
+            coef = np.append(coef, z_offset - X_offsets @ coef)
+            cov_coef_intercept = -self.cov_ @ X_offsets
+            var_intercept = self.scale_ / self.total_weight_ - X_offsets @ cov_coef_intercept
+            self.cov_ = np.block([
+                [self.cov_, cov_coef_intercept[:, np.newaxis]],
+                [cov_coef_intercept[np.newaxis, :], var_intercept]
+            ])
+        self.cov_type_, self.cov_factor_ = "nonrobust", None
+
+        se_coef = np.sqrt(np.diagonal(self.cov_))
+        self.t_ = coef / se_coef
+        self.p_ = 2 * stats.t.sf(abs(self.t_), self._inference_df)
+        lower_bound, upper_bound = _confint(coef, se_coef, self._inference_df, .975)
+
+        table = pd.DataFrame(OrderedDict((
+            ("Coefficient", coef), ("SE", se_coef),
+            ("t" if not family.fixed_scale else "z", self.t_), ("p", self.p_),
+            ("2.5%", lower_bound), ("97.5%", upper_bound)
+        )), index=cols)
+
+        self.coef_ = table["Coefficient"]
+        self.se_coef_ = table["SE"]
+        self._publish_snapshot()
+        return table
+
+    def _recompute_artifacts(self):
+        X, y, eta, _ = super(GeneralizedLinearModel, self)._recompute_artifacts()
+        fitted = self.family.inverse_link(np.asarray(eta, dtype=float))
+        fitted = pd.Series(fitted, index=y.index)
+        return X, y, fitted, y - fitted
+
+    def log_likelihood(self, data=None):
+        ''' Calculate the log likelihood of the fitted model on either the training data or new data. '''
+        if data is None:
+            return self.log_likelihood_
+        y = self.re.evaluate(data, fit=False).iloc[:, 0].to_numpy(dtype=float)
+        mu = self.predict(data).iloc[:, 0].to_numpy(dtype=float)
+        return self.family.log_likelihood(y, mu, self.scale_, np.ones(len(y)))
+
+    def predict(self, data, for_plot=False, confidence_interval=False, prediction_interval=False, link=False,
+                na_action=None):
+        ''' Predict the mean response.
+
+        Arguments:
+            data - A DataFrame containing the values of the explanatory variables.
+            for_plot - A boolean kept for compatibility with LinearModel.predict.
+            confidence_interval - If a confidence interval for the mean response is desired, this is
+                a float between 0.0 and 1.0 indicating the non-coverage probability to use. The interval
+                is formed on the scale of the linear predictor and then transformed.
+            prediction_interval - Not available for GeneralizedLinearModels.
+            link - A boolean indicating if predictions are on the scale of the linear predictor (True)
+                or of the response (False).
+            na_action - An optional str, "drop" or "raise", for rows with missing values. See LinearModel.predict.
+
+        Returns:
+            A DataFrame containing the predictions and/or intervals.
+        '''
+        if prediction_interval:
+            raise Exception("Prediction intervals are not available for GeneralizedLinearModels.")
+        data = self._prediction_rows(as_source(data), na_action)
+        snapshot = self.snapshot_
+        X = self._design(data, snapshot)
+        coefs = snapshot.coef
+        eta = X @ coefs[:-1] + coefs[-1] if self.intercept else X @ coefs
+        transform = (lambda values: values) if link else self.family.inverse_link
+        predictions = pd.DataFrame({"Predicted " + str(self.re) : transform(eta)})
+
+        if confidence_interval:
+            crit_prob = 1 - (confidence_interval / 2)
+            df = np.inf if self.family.fixed_scale else snapshot.rdf
+            widths = _t_crit(crit_prob, df) * np.sqrt(self._mean_variances(X, snapshot))
+            # All of the links are increasing, so the bounds keep their order
+            predictions[str(round(1 - crit_prob, 5) * 100) + "%"] = transform(eta - widths)
+            predictions[str(round(crit_prob, 5) * 100) + "%"] = transform(eta + widths)
+
+        if na_action == "drop":
+            predictions.index = data.index
+        return predictions
@@ -1,17 +1,26 @@
 import numpy as np
 
 import scipy.stats as stats
-from scipy.linalg import solve_triangular, cho_solve
+from scipy.linalg import solve_triangular
 
 import pandas as pd
 from pandas.plotting import scatter_matrix
 
 import matplotlib.pyplot as plt
 
+import json
+
 from itertools import product
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
-from .expression import Expression, Var, Quantitative, Categorical, Interaction, Combination, Identity, Constant
+from .expression import Expression, Var, Quantitative, Categorical, Interaction, Combination, Identity, Constant, _from_spec
+from .predictor import CompiledPredictor
+from .codegen import _generate_source
+from .solvers import Solver, qr_solve, cho_inv, _solve, _count_sketch
+from .shared import SharedDesign, attach
+from .sources import as_source, _read_csv, _concat_chunks
 
 plt.style.use('ggplot')
 
@@ -35,29 +44,230 @@ def _float_format(x):
 
 pd.set_option("display.float_format", _float_format)
 
+@lru_cache(maxsize=256)
+def _t_crit(crit_prob, df):
+    ''' Critical value of a t distribution, cached per (probability, degrees of freedom). '''
+    return stats.t.ppf(crit_prob, df)
+
+@lru_cache(maxsize=256)
+def _f_crit(crit_prob, dfn, dfd):
+    ''' Critical value of an F distribution, cached per (probability, degrees of freedom). '''
+    return stats.f.ppf(crit_prob, dfn, dfd)
+
 def _confint(estimates, standard_errors, df, crit_prob):
-    crit_value = stats.t.ppf(crit_prob, df)
+    crit_value = _t_crit(crit_prob, df)
     ci_widths = crit_value * standard_errors
     return estimates - ci_widths, estimates + ci_widths
 
-def qr_solve(Q, R, y):
-    ''' Solve least squares X \ y, given QR decomposition of X '''
-    _, p = R.shape
-    if p:
-        return solve_triangular(R, Q.T @ y, check_finite=False)
+# Covariance estimators for the coefficients
+_cov_types = ("nonrobust", "HC0", "HC1", "HC2", "HC3", "cluster")
+_na_actions = ("drop", "raise")
+
+def _sandwich(D, e, bread, cov_type, codes=None, n_params=0):
+    ''' Robust covariance bread @ meat @ bread for the (n x k) design D with residuals e, where bread = (D'D)^-1.
+
+    The meat is a weighted Gram product for the HC estimators (with leverage adjustments for HC2 and HC3), 
+    or the Gram product of per-cluster score sums (segment sums over rows sorted by cluster) for "cluster".
+    Nothing larger than n x k is ever formed.
+    '''
+    n, k = D.shape
+    if cov_type == "cluster":
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        scores = np.add.reduceat(D[order] * e[order, np.newaxis], starts, axis=0) if k else np.empty((len(starts), 0))
+        n_clusters = len(starts)
+        meat = scores.T @ scores * (n_clusters / (n_clusters - 1)) * ((n - 1) / (n - n_params))
     else:
-        return np.empty(shape=0)
-
-def cho_inv(R):
-    ''' Calculate inverse of X.T @ X, given Cholesky decomposition R.T @ R '''
+        scale = e ** 2
+        if cov_type in ("HC2", "HC3"):
+            leverages = np.einsum('ij,ij->i', D @ bread, D)
+            scale = scale / (1 - leverages) ** (1 if cov_type == "HC2" else 2)
+        meat = (D * scale[:, np.newaxis]).T @ D
+        if cov_type == "HC1":
+            meat *= n / (n - n_params)
+    return bread @ meat @ bread
+
+def _cov_factor(cov):
+    ''' A factor L with L L' = cov. Cholesky when possible, otherwise from the eigendecomposition 
+    (robust covariances can be singular, e.g. with fewer clusters than coefficients). '''
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        return vectors * np.sqrt(np.clip(values, 0, None))
+
+# Which training artifacts a LinearModel keeps after fitting, from least to most
+_retain_options = ("none", "summary", "residuals", "all")
+
+# Upper bound on the number of elements in one block of design rows when computing interval widths
+_INTERVAL_BLOCK_ELEMENTS = 2 ** 20
+
+# Upper bound on the number of elements in one batch of resampled responses (n rows x replicates)
+_RESAMPLE_BATCH_ELEMENTS = 2 ** 22
+
+def _batch_sizes(total, n, chunk_size=None):
+    ''' Split a number of replicates into batches whose n x batch response blocks stay bounded in memory. '''
+    if chunk_size is None:
+        chunk_size = max(1, _RESAMPLE_BATCH_ELEMENTS // max(n, 1))
+    elif chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1.")
+    sizes = [chunk_size] * (total // chunk_size)
+    if total % chunk_size:
+        sizes.append(total % chunk_size)
+    return sizes
+
+def _centered_qr_coefs(Q, R, Y, X_offsets, intercept):
+    ''' Solve least squares for every column of Y at once, given the QR decomposition of the centered design.
+
+    Returns:
+        A (p x B) array of coefficients, with the intercept as the last row if applicable.
+    '''
     _, p = R.shape
     if p:
-        return cho_solve((R, False), np.identity(p), check_finite=False)
+        coefs = solve_triangular(R, Q.T @ Y, check_finite=False)
     else:
-        return np.empty(shape=(0, 0))
+        coefs = np.empty(shape=(0, Y.shape[1]))
+    if intercept:
+        coefs = np.vstack([coefs, Y.mean(axis=0) - X_offsets @ coefs])
+    return coefs
+
+def _pairs_bootstrap_chunk(X, y, intercept, seed, size):
+    ''' Refit a model on `size` case-resampled copies of (X, y). Returns a (p x size) array of coefficients. '''
+    rng = np.random.default_rng(seed)
+    n, p = X.shape
+    coefs = np.empty(shape=(p + (1 if intercept else 0), size))
+    for b in range(size):
+        idx = rng.integers(0, n, n)
+        Xb, yb = X[idx], y[idx]
+        if intercept:
+            X_offsets, y_offset = Xb.mean(axis=0), yb.mean()
+            Xb, yb = Xb - X_offsets, yb - y_offset
+        q, r = np.linalg.qr(Xb)
+        coefs[:p, b] = qr_solve(q, r, yb)
+        if intercept:
+            coefs[p, b] = y_offset - X_offsets @ coefs[:p, b]
+    return coefs
+
+def _leverage_scores(R, X, offsets):
+    ''' Squared norms of R^-T (x - offsets) for each row x of X, in blocks of rows so memory stays proportional 
+    to the block size rather than the data. With R from the centered design, these are the leverages. '''
+    n, p = X.shape
+    scores = np.zeros(n)
+    if p:
+        block_rows = max(1, _INTERVAL_BLOCK_ELEMENTS // p)
+        for start in range(0, n, block_rows):
+            block = (X[start:start + block_rows] - offsets).T
+            z = solve_triangular(R, block, trans='T', check_finite=False)
+            scores[start:start + block_rows] = np.einsum('ij,ij->j', z, z)
+    return scores
+
+def _absorb_groups(data, names):
+    ''' Integer-code each absorbed factor. Returns a list of (codes, counts, levels) tuples. '''
+    groups = []
+    for name in names:
+        codes, levels = pd.factorize(data[name])
+        if (codes < 0).any():
+            raise Exception("Absorbed factor '{}' has missing values.".format(name))
+        groups.append((codes, np.bincount(codes, minlength=len(levels)), levels))
+    return groups
+
+def _group_means(M, group, weights=None):
+    ''' The (weighted) means of the columns of M (n x k) within each level of one absorbed factor.
+
+    Returns:
+        A tuple of the levels, a (levels x k) array of means, and the total weight of each level.
+    '''
+    codes, counts, levels = group
+    totals = counts if weights is None else np.bincount(codes, weights=weights, minlength=len(counts))
+    sums = np.zeros((len(counts), M.shape[1]))
+    for j in range(M.shape[1]):
+        sums[:, j] = np.bincount(codes, weights=M[:, j] if weights is None else weights * M[:, j], minlength=len(counts))
+    return levels, sums / totals[:, np.newaxis], totals
+
+def _group_demean(M, groups, weights=None, tol=1e-10, max_iter=1000):
+    ''' Sweep the (weighted) group means of every factor out of the columns of M (n x k) by alternating projections.
+
+    A single factor takes one pass. With several factors the sweeps repeat until the removed means 
+    are negligible, converging to the projection onto the complement of all the factors' dummies.
+
+    Returns:
+        A tuple of the demeaned (n x k) array and a list with a (levels x k) array of accumulated
+        effects for each factor, so that M = demeaned + sum of effects[codes].
+    '''
+    M = np.array(M, dtype=float)
+    effects = [np.zeros((len(counts), M.shape[1])) for codes, counts, levels in groups]
+    totals = [counts if weights is None else np.bincount(codes, weights=weights, minlength=len(counts))
+              for codes, counts, levels in groups]
+    scale = max(1.0, np.abs(M).max()) if M.size else 1.0
+    for iteration in range(max_iter):
+        largest = 0.0
+        for (codes, counts, levels), total, effect in zip(groups, totals, effects):
+            means = np.column_stack([np.bincount(codes, weights=col if weights is None else weights * col, minlength=len(counts))
+                                     for col in M.T]) / total[:, np.newaxis]
+            M -= means[codes]
+            effect += means
+            largest = max(largest, np.abs(means).max()) if means.size else largest
+        if len(groups) == 1 or largest <= tol * scale:
+            break
+    return M, effects
+
+def _resolve_weights(data, weights):
+    ''' Look up the weights for each row of data from a column name or an array. Float columns are used without copying. '''
+    values = np.asarray(data[weights] if isinstance(weights, str) else weights, dtype=float)
+    if values.shape != (len(data),):
+        raise ValueError("weights must give a weight for every row.")
+    if not np.isfinite(values).all() or (values <= 0).any():
+        raise ValueError("weights must be positive and finite.")
+    return values
+
+def _missing_rows(data, names, arrays=()):
+    ''' One boolean mask of the rows with a missing value in any of the named columns of data (or in any 
+    of the extra arrays), reading only those columns. Returns the mask and the names of the columns with missing values. '''
+    missing = np.zeros(len(data), dtype=bool)
+    incomplete = []
+    for name in names:
+        column = pd.isna(data[name]).to_numpy()
+        if column.any():
+            missing |= column
+            incomplete.append(name)
+    for values in arrays:
+        missing |= pd.isna(np.asarray(values))
+    return missing, incomplete
+
+def _check_na_action(na_action, allow_none=False):
+    if not (na_action in _na_actions or (allow_none and na_action is None)):
+        raise ValueError("na_action must be one of {}.".format(_na_actions + ((None,) if allow_none else ())))
+
+_pairs_worker_data = dict()
+
+def _pairs_worker_init(handle):
+    ''' Process pool initializer: each worker attaches to the shared design by name instead of receiving a copy. '''
+    _pairs_worker_data["design"] = attach(handle)
+
+def _pairs_worker_chunk(seed, size):
+    design = _pairs_worker_data["design"]
+    return _pairs_bootstrap_chunk(design.X, design.y, design.handle.intercept, seed, size)
+
+class FittedSnapshot(namedtuple("FittedSnapshot", ["explanatory", "response", "columns", "coef", "r", "X_offsets",
+                                                     "total_weight", "resid_var", "rdf", "cov_type", "cov_factor",
+                                                     "fixed_effects", "group_means"])):
+    ''' The state a fitted model predicts from: the fitted Expressions (holding the learned Categorical levels 
+    and Transformation statistics, separately from the symbolic Expressions the model was created with), the 
+    design columns in coefficient order (without the intercept), the coefficients, everything interval widths
+    are computed from (the R factor and offsets of the centered design, the total weight, the residual variance
+    and degrees of freedom, and the covariance type and factor), and the absorbed fixed effects (with the design's
+    means and total weight within each level, for interval widths).
+
+    A fit publishes a new snapshot in a single assignment and never modifies an earlier one, and evaluating
+    the fitted Expressions with fit=False does not modify them, so predictions can run concurrently from 
+    several threads without locks.
+    '''
+    __slots__ = ()
+
 
 class Model:
-    ''' A general Model class that both Linear models and (in the future) General Linear models stem from. '''
+    ''' A general Model class that both Linear models and Generalized Linear models stem from. '''
 
     def __init__(self):
         ''' Create a Model object (only possible through inheritance). '''
@@ -102,7 +312,7 @@ class Model:
 class LinearModel(Model):
     '''A specific Model that assumes the response variable is linearly related to the explanatory variables. '''
 
-    def __init__(self, explanatory, response, intercept=True):
+    def __init__(self, explanatory, response, intercept=True, retain="all", absorb=None):
         '''Create a LinearModel object. 
 
         An intercept is included in the model by default. To fit a model without an intercept term,
@@ -113,7 +323,23 @@ class LinearModel(Model):
             response - An Expression that represents the single term for the response variables. This is the y. 
                 If this is a Combination, the terms will be added together and treated as a single variable.
             intercept - A boolean indicating whether an intercept should be included (True) or not (False).
+            retain - A str controlling which training artifacts are kept after fitting:
+                "all" keeps everything (default).
+                "residuals" keeps the response, fitted values, and residuals, but not the design matrix.
+                "summary" keeps only a reference to the training data; artifacts are recomputed when accessed.
+                "none" keeps nothing from training. Predictions, inference, and summary statistics still work.
+            absorb - An optional categorical variable (a str name, Var, or Categorical) or list of them whose fixed
+                effects are absorbed rather than estimated as dummy columns. The explanatory variables and response are
+                demeaned within the levels of each factor (alternating projections for several factors), which is much
+                cheaper than one-hot encoding high-cardinality factors. The intercept is absorbed as well. Levels unseen 
+                in training predict NaN. With a single absorbed factor, prediction and confidence intervals account for 
+                the estimated effect of each row's level as well as the slopes (as if its dummy columns were estimated);
+                they are not available with several absorbed factors or a robust covariance.
         '''
+        if retain not in _retain_options:
+            raise ValueError("retain must be one of {}.".format(_retain_options))
+        self.retain = retain
+
         if explanatory is None:
             explanatory = 0
 
@@ -130,23 +356,40 @@ class LinearModel(Model):
         self.intercept = constant is not None
         if self.intercept:
             self.given_ex = self.given_ex - constant # This was done to easily check all options for indicating a wanted intercept
+
+        if absorb is None:
+            absorb = []
+        elif not isinstance(absorb, (list, tuple)):
+            absorb = [absorb]
+        self.absorb = [factor if isinstance(factor, str) else factor.name for factor in absorb]
+        if self.absorb:
+            self.intercept = False # Subsumed by the absorbed effects
+        self.fixed_effects_, self.group_means_ = dict(), None
+        self.weights_, self.sample_info_, self._sample_source = None, None, None
+        self.data_index_, self.dropped_rows_ = None, None
+        self.schema = None
                 
         self.given_re = Identity(response) # This will collapse any combination of variables into a single column
         self.ex = None
         self.re = None
 
         self.training_data = None
+        self._X_train, self._y_train, self._fitted, self._residuals, self._q = None, None, None, None, None
 
         self.categorical_levels = dict()
         
     def __str__(self):
         ''' Convert a LinearModel to a str format for printing. '''
         if self.intercept:
-            return str(self.given_re) + " ~ " + str(1 + self.given_ex)
+            formula = str(self.given_re) + " ~ " + str(1 + self.given_ex)
         else:
-            return str(self.given_re) + " ~ " + str(self.given_ex)
+            formula = str(self.given_re) + " ~ " + str(self.given_ex)
+        if self.absorb:
+            formula += " | " + " + ".join(self.absorb)
+        return formula
 
-    def fit(self, X, y=None):
+    def fit(self, X, y=None, solver="auto", sample=None, stratify=None, seed=None, cov_type="nonrobust", groups=None,
+            weights=None, na_action="drop", schema=None):
         '''Fit a LinearModel to data..
 
         Data can either be provided as a single DataFrame X that contains both the explanatory 
@@ -159,65 +402,383 @@ class LinearModel(Model):
 
         Arugments:
             X - A DataFrame containing all of the explanatory variables in the model
-                and possibly the response variable too.
+                and possibly the response variable too. This can also be a ColumnSource, a dict of 
+                (memory mapped) arrays, a pyarrow Table, or a path to a Parquet file or a directory of .npy
+                columns (see salmon.sources), in which case only the columns the model uses are read.
             y - An optional Series that contains the response variable.
+            solver - A str naming the least squares backend ("qr", "cholesky", "svd", "tsqr", "lsqr", "sketch"), a Solver
+                object, or "auto" (default) to pick one from the size, shape, sparsity and conditioning of the design.
+                The backend used is recorded in Model.solver_. Randomized backends like "sketch" give approximate
+                standard errors and intervals, which is flagged by Model.approximate_ being True.
+            sample - An optional int number of rows (or float fraction of rows) to fit on instead of all of the data, 
+                for quickly exploring formulas on large tables. Rows are drawn with probability proportional to 
+                their (sketched) leverage scores, or within the levels of stratify, and the fit is reweighted so 
+                it estimates the full-data fit. How well the sample represents the data is reported in 
+                Model.sample_info_, and Model.promote() refits on all of the data.
+            stratify - An optional str name of a categorical column to sample within, in proportion to level sizes.
+            seed - An optional seed for drawing the sample.
+            cov_type - A str naming the covariance estimator for the coefficients: "nonrobust" (default), 
+                the heteroskedasticity-robust "HC0", "HC1", "HC2", "HC3", or "cluster" for cluster-robust. 
+                The chosen covariance is used for the coefficient table, confidence intervals, prediction 
+                intervals and anova (as Wald tests).
+            groups - For cov_type="cluster", a str name of the column (or an array) giving each row's cluster.
+            weights - An optional str name of a column (or an array) of positive weights for each row, to fit by 
+                weighted least squares (e.g., survey or precision weights). The weights carry through the 
+                centering, residual variance, intervals, log likelihood, anova and stepwise.
+            na_action - A str, either "drop" (default) to fit on the rows with no missing values in the columns 
+                the model uses (the labels of the dropped rows are kept in Model.dropped_rows_, see 
+                Model.na_pad), or "raise" to raise a ValueError if any of those values are missing.
+            schema - An optional Schema (e.g. from Schema.infer) giving the kind of each variable and the levels 
+                of categorical variables, instead of inferring them from the data. The schema is kept by the 
+                model and used by the models that anova, stepwise and partial plots fit from it.
 
         Returns:
             A DataFrame containing relevant statistics of fitted Model (e.g., coefficients, p-values).
         '''
+        X = self._read_columns(X, weights, groups, stratify)
         if y is None:
             data = X
         else:
             data = pd.concat([X, y], axis = 1)
-        return self._fit(data)
+        if cov_type not in _cov_types:
+            raise ValueError("cov_type must be one of {}.".format(_cov_types))
+        if cov_type == "cluster" and groups is None:
+            raise ValueError("Cluster-robust covariance requires groups.")
+        data, weights, groups = self._drop_missing(data, na_action, weights, groups, stratify)
+        if weights is not None:
+            weights = _resolve_weights(data, weights)
+        self.schema = schema
+        if sample is None:
+            self._sample_source = None
+            return self._fit(data, solver, weights=weights, cov_type=cov_type, groups=groups)
+
+        if self.absorb:
+            raise Exception("Models with absorbed effects do not support fitting on a sample.")
+        self._sample_source = data
+        self._sample_options = dict(solver=solver, cov_type=cov_type, groups=groups, weights=weights, schema=schema)
+        return self._fit(data, solver, sample=(sample, stratify, seed), weights=weights, cov_type=cov_type, groups=groups)
+
+    def promote(self):
+        ''' Refit a model that was fit on a sample (see LinearModel.fit) on all of the data the sample was drawn from.
+
+        Returns:
+            A DataFrame containing relevant statistics of the fitted Model.
+        '''
+        if self._sample_source is None:
+            raise Exception("The model was not fit on a sample.")
+        return self.fit(self._sample_source, **self._sample_options)
+
+    def _draw_sample(self, data, X, sample, stratify, seed):
+        ''' Draw the rows (and their weights) to fit on. See LinearModel.fit.
+
+        Returns:
+            A tuple of the sampled row positions, their weights (normalized to a mean of 1), the R factor of 
+            a sketch of the full centered design, and a dict describing the sample.
+        '''
+        N, p = X.shape
+        m = int(round(sample * N)) if isinstance(sample, float) else int(sample)
+        coefficients = p + (1 if self.intercept else 0)
+        if not coefficients < m <= N:
+            raise ValueError("The sample must have more rows than the model has coefficients and no more rows than the data.")
+        rng = np.random.default_rng(seed)
+
+        X_values = X.to_numpy(dtype=float)
+        offsets = X_values.mean(axis=0) if self.intercept else np.zeros(p)
+        sketch = _count_sketch(N, min(N, max(1000, 20 * p, p * p)), rng)
+        r_sketch = np.linalg.qr(sketch @ X_values - np.outer(sketch @ np.ones(N), offsets), mode="r")
+
+        if stratify is None:
+            # Mix in uniform probabilities so every row has some chance of being drawn
+            scores = _leverage_scores(r_sketch, X_values, offsets)
+            probabilities = 0.9 * scores / scores.sum() + 0.1 / N
+            inclusion = np.minimum(1, m * probabilities)
+            rows = np.flatnonzero(rng.random(N) < inclusion)
+            weights = 1 / inclusion[rows]
+            method = "leverage"
+        else:
+            codes, levels = pd.factorize(data[stratify])
+            counts = np.bincount(codes, minlength=len(levels))
+            allocation = np.minimum(counts, np.maximum(2, np.round(m * counts / N).astype(int)))
+            rows = np.sort(np.concatenate([rng.choice(np.flatnonzero(codes == k), allocation[k], replace=False)
+                                           for k in range(len(levels))]))
+            weights = (counts / allocation)[codes[rows]]
+            method = "stratified by " + str(stratify)
+        # The draw is random (and strata are rounded), so the sample can come out smaller than asked for
+        if len(rows) <= coefficients:
+            raise ValueError("The sample drew {} rows, which is not more than the {} coefficients of the model. "
+                             "Use a larger sample.".format(len(rows), coefficients))
+        weights = weights / weights.mean()
+
+        info = OrderedDict((
+            ("Method", method),
+            ("Rows", N),
+            ("Sampled rows", len(rows)),
+            ("Effective rows", weights.sum() ** 2 / (weights ** 2).sum())
+        ))
+        return rows, weights, r_sketch, info
+
+    def _sample_report(self, info, X_full, y_full, rows, weights, r_sketch):
+        ''' Describe how well a weighted sample represents the full data.
+
+        Distortion is the largest relative error of the sample's Gram matrix against a sketch of the full one
+        (near 0 means the sample preserves the geometry of the design). Holdout MSE ratio compares the mean 
+        squared error on rows outside the sample to the estimated residual variance (near 1 is good).
+        '''
+        N, p = X_full.shape
+        Xw = np.sqrt(weights)[:, np.newaxis] * (X_full[rows] - self.X_offsets_)
+        if p:
+            left = solve_triangular(r_sketch, (Xw.T @ Xw) * (N / len(rows)), trans='T', check_finite=False)
+            whitened = solve_triangular(r_sketch, left.T, trans='T', check_finite=False)
+            info["Distortion"] = np.abs(np.linalg.eigvalsh((whitened + whitened.T) / 2) - 1).max()
+        else:
+            info["Distortion"] = 0.0
+
+        outside = np.setdiff1d(np.arange(N), rows)
+        if len(outside):
+            outside = np.random.default_rng(0).choice(outside, min(len(outside), max(len(rows), 10000)), replace=False)
+            coefs = self.coef_.values
+            predicted = X_full[outside] @ coefs[:p] + (coefs[-1] if self.intercept else 0)
+            info["Holdout MSE ratio"] = ((y_full[outside] - predicted) ** 2).mean() / self.resid_var_
+        else:
+            info["Holdout MSE ratio"] = np.nan
+        return pd.Series(info, name="Sample")
+
+    def _submodel(self, explanatory, response=None):
+        ''' Create an unfitted model of the same kind (and options) with different terms, e.g. for anova and stepwise. '''
+        model = LinearModel(explanatory, self.given_re if response is None else response,
+                            intercept=self.intercept, absorb=self.absorb)
+        model.schema = self.schema
+        return model
+
+    def _required_columns(self, *names, response=True):
+        ''' The names of the columns the model's Expressions (and absorbed effects) use, plus any other 
+        column names given in names. '''
+        needed = set(self.absorb) | {name for name in names if isinstance(name, str)}
+        for expression in ((self.given_ex, self.given_re) if response else (self.given_ex,)):
+            terms = expression.reduce()
+            needed.update(var.name for kind in ("Q", "C", "V") for var in terms[kind])
+        return needed
+
+    def _drop_missing(self, data, na_action, weights=None, groups=None, stratify=None):
+        ''' Find the rows of the training data with missing values, from one mask over only the columns the
+        model uses (and the weights and groups), and drop them (see LinearModel.fit).
+
+        Rows are dropped before anything is evaluated, so Categorical levels and Transformation statistics 
+        are only learned from the rows that are fit. When nothing is missing the data is used as is; 
+        otherwise a single copy of just the used columns of the complete rows is made.
+
+        Returns:
+            A tuple of the data, weights and groups for the complete rows.
+        '''
+        _check_na_action(na_action)
+        needed = self._required_columns(weights, groups, stratify)
+        names = [name for name in data.columns if name in needed]
+        arrays = [values for values in (weights, groups) if values is not None and not isinstance(values, str)]
+        missing, incomplete = _missing_rows(data, names, arrays)
+        self.data_index_ = data.index
+        self.dropped_rows_ = data.index[missing]
+        if not missing.any():
+            return data, weights, groups
+        if na_action == "raise":
+            raise ValueError("{} rows have missing values (in columns {}).".format(missing.sum(), incomplete))
+        keep = ~missing
+        data = data.loc[keep, names]
+        if weights is not None and not isinstance(weights, str):
+            weights = np.asarray(weights)[keep]
+        if groups is not None and not isinstance(groups, str):
+            groups = np.asarray(groups)[keep]
+        return data, weights, groups
+
+    def na_pad(self, values):
+        ''' Re-align values for the rows a model was fit on (e.g. Model.residuals_ or Model.fitted_) to every 
+        row of the data given to fit, with NaN for the rows dropped for missing values.
+
+        Arguments:
+            values - A Series (or DataFrame) indexed like the rows that were fit.
 
-    def _fit(self, data):
+        Returns:
+            A Series (or DataFrame) with the index of the data given to fit.
+        '''
+        if self.data_index_ is None:
+            raise Exception("The model was not fit on data (e.g. it was loaded).")
+        return values.reindex(self.data_index_)
+
+    def _column_dtypes(self):
+        ''' dtypes to read columns with: float for Quantitative variables and category for Categorical ones. 
+        Variables that are used both ways (or not yet interpreted) are left for the reader to infer. '''
+        kinds = dict()
+        for expression in (self.given_ex, self.given_re):
+            terms = expression.reduce()
+            for kind, dtype in (("Q", float), ("C", "category"), ("V", None)):
+                for var in terms[kind]:
+                    kinds.setdefault(var.name, set()).add(dtype)
+        return {name: dtypes.pop() for name, dtypes in kinds.items() if len(dtypes) == 1 and None not in dtypes}
+
+    def _read_columns(self, data, *names):
+        ''' Read only the columns the model's Expressions use (and any other columns named in names) 
+        from a column source into a DataFrame. DataFrames are returned as is. '''
+        data = as_source(data)
+        if isinstance(data, pd.DataFrame):
+            return data
+        needed = self._required_columns(*names)
+        return data.to_frame([name for name in data.columns if name in needed])
+
+    def fit_file(self, path, chunksize=None, read_options=None, **fit_options):
+        ''' Fit the model on a CSV file, parsing only the columns the model uses.
+
+        Quantitative variables are read as floats and Categorical variables as pandas categories,
+        which is much faster (and smaller) than reading the whole file and converting afterwards.
+
+        Arguments:
+            path - A str path (or buffer) of a CSV file, as for pd.read_csv.
+            chunksize - An optional int number of rows to parse at a time, which bounds the memory the 
+                parser uses on very long files. The chunks are combined before fitting.
+            read_options - An optional dict of other keyword arguments for pd.read_csv (e.g. sep, na_values).
+            fit_options - Keyword arguments for fit (e.g. weights, solver).
+
+        Returns:
+            A DataFrame containing relevant statistics of fitted Model (e.g., coefficients, p-values).
+        '''
+        extra = [fit_options.get(name) for name in ("weights", "groups", "stratify")]
+        data = _read_csv(path, self._required_columns(*extra), self._column_dtypes(), chunksize, read_options)
+        if chunksize is not None:
+            data = _concat_chunks(list(data))
+        return self.fit(data, **fit_options)
 
+    def predict_file(self, path, chunksize=None, read_options=None, **predict_options):
+        ''' Predict response values for the rows of a CSV file, parsing only the columns the model uses.
+
+        This function assumes that Model.fit() has already been called.
+
+        Arguments:
+            path - A str path (or buffer) of a CSV file, as for pd.read_csv.
+            chunksize - An optional int number of rows to parse and predict at a time, so memory use is
+                bounded by the chunk size rather than the file.
+            read_options - An optional dict of other keyword arguments for pd.read_csv.
+            predict_options - Keyword arguments for predict (e.g. confidence_interval).
+
+        Returns:
+            A DataFrame containing the predictions and/or intervals.
+        '''
+        names = self._required_columns(response=False)
+        data = _read_csv(path, names, self._column_dtypes(), chunksize, read_options)
+        if chunksize is None:
+            return self.predict(data, **predict_options)
+        return pd.concat([self.predict(chunk, **predict_options) for chunk in data], ignore_index=True)
+
+    def _evaluate_training(self, data):
+        ''' Interpret the Expressions on the training data and evaluate the design and response. '''
         # Initialize the categorical levels
         self.categorical_levels = dict()
         self.training_data = data
         
-        # Replace all Var's with either Q's or C's
+        # Replace all Var's with either Q's or C's, from the schema if there is one
+        source = data if self.schema is None else self.schema
         self.re = self.given_re.copy()
-        self.re = self.re.interpret(data)
+        self.re = self.re.interpret(source)
 
         self.ex = self.given_ex.copy()
-        self.ex = self.ex.interpret(data)
+        self.ex = self.ex.interpret(source)
 
-        terms = self.ex.reduce()
-        
         # Construct X matrix
         X = self.ex.evaluate(data)
-        self.X_train_ = X
         # Construct y vector
         y = self.re.evaluate(data).iloc[:, 0]
-        self.y_train_ = y
+        return X, y
+
+    @property
+    def _inference_df(self):
+        ''' Degrees of freedom of the t distributions used for inference on the coefficients. '''
+        return self.rdf
+
+    def _fit(self, data, solver="auto", sample=None, weights=None, cov_type="nonrobust", groups=None):
+
+        X, y = self._evaluate_training(data)
+        # Read the clusters now, as the training data is let go of with retain="none"
+        if isinstance(groups, str):
+            groups = np.asarray(data[groups])
+
+        # Keep only the sampled rows, with the full design (and any learned levels or statistics) behind them
+        self.sample_info_ = None
+        if sample is not None:
+            X_full, y_full = X.to_numpy(dtype=float), y.to_numpy(dtype=float)
+            rows, sample_weights, r_sketch, info = self._draw_sample(data, X, *sample)
+            weights = sample_weights if weights is None else np.asarray(weights)[rows] * sample_weights
+            X, y = X.iloc[rows], y.iloc[rows]
+            self.training_data = data.iloc[rows]
+            if groups is not None:
+                groups = np.asarray(groups)[rows]
+        self.weights_ = None if weights is None else np.asarray(weights, dtype=float)
 
         # Get dimensions
         self.n, self.p = X.shape
+        self.total_weight_ = self.n if weights is None else self.weights_.sum()
         
-        # Center if there is an intercept
-        if self.intercept:
-            X_offsets = X.mean()
-            y_offset = y.mean()
+        X_values, y_values = X.to_numpy(dtype=float), y.to_numpy(dtype=float)
+        root_weights = None if weights is None else np.sqrt(self.weights_)
+        
+        # Center if there is an intercept, or sweep out the absorbed effects
+        if self.absorb:
+            absorbed = _absorb_groups(data, self.absorb)
+            within, _ = _group_demean(np.column_stack([X_values, y_values]), absorbed, self.weights_)
+            Xc, yc = within[:, :-1], within[:, -1]
+            X_offsets = np.average(X_values, axis=0, weights=self.weights_)
+            y_offset = 0
+            # New rows are centered at the means of their level for interval widths. With several crossed factors the
+            # variance of the estimated effects needs the whole dummy design, so intervals are not available then
+            self.group_means_ = _group_means(X_values, absorbed[0], self.weights_) if len(absorbed) == 1 else None
+        elif self.intercept:
+            X_offsets = np.average(X_values, axis=0, weights=self.weights_)
+            y_offset = np.average(y_values, weights=self.weights_)
         else:
-            X_offsets = 0
+            X_offsets = np.zeros(self.p)
             y_offset = 0
-        Xc = X - X_offsets
-        yc = y - y_offset
         
-        # Get coefficients using QR decomposition
-        q, r = np.linalg.qr(Xc)
-        coef_ = qr_solve(q, r, yc)
-        cols = list(Xc) # column names
+        # Get coefficients and the R factor of the centered design
+        if self.absorb:
+            if weights is None:
+                backend, coef_, r, q = _solve(Xc, yc, np.zeros(self.p), solver)
+            else:
+                backend, coef_, r, q = _solve(root_weights[:, np.newaxis] * Xc, root_weights * yc, np.zeros(self.p), solver)
+        elif weights is not None:
+            # The weighted problem is solved on a single centered and scaled copy of the design
+            Xw = X_values - X_offsets
+            Xw *= root_weights[:, np.newaxis]
+            backend, coef_, r, q = _solve(Xw, root_weights * (y_values - y_offset), np.zeros(self.p), solver)
+            del Xw
+        else:
+            backend, coef_, r, q = _solve(X_values, y_values - y_offset, X_offsets, solver)
+        self.solver_ = backend.name
+        self.approximate_ = backend.approximate
+        cols = list(X.columns) # column names
+
+        # Keep the factorization of the centered design so resampling procedures can reuse it
+        self.r_ = r
+        self.X_offsets_ = X_offsets
+        self.y_offset_ = y_offset
 
         # Get fitted values and residuals
-        self.fitted_ = y_offset + np.dot(Xc, coef_)
-        self.residuals_ = y - self.fitted_
+        if self.absorb:
+            residuals = pd.Series(yc - Xc @ coef_, index=y.index)
+            fitted = y - residuals
+            _, effects = _group_demean((y_values - X_values @ coef_)[:, np.newaxis], absorbed, self.weights_)
+            self.fixed_effects_ = {name: pd.Series(effect[:, 0], index=levels, name=name)
+                                   for name, (codes, counts, levels), effect in zip(self.absorb, absorbed, effects)}
+        else:
+            fitted = y_offset + X_values @ coef_ - X_offsets @ coef_
+            residuals = y - fitted
+        if weights is None:
+            self.sse_ = (residuals ** 2).sum()
+            self.sst_ = ((y - y.mean()) ** 2).sum()
+        else:
+            self.sse_ = (self.weights_ * residuals ** 2).sum()
+            self.sst_ = (self.weights_ * (y - np.average(y, weights=self.weights_)) ** 2).sum()
+        self._retain_artifacts(X, y, fitted, residuals, q)
         
-        # Get residual variance
-        self.rdf = self.n - self.p - (1 if self.intercept else 0)
-        self.resid_var_ = (self.residuals_ ** 2).sum() / self.rdf
+        # Get residual variance. Each absorbed factor after the first has one level that is redundant with the others
+        self.absorbed_df = sum(len(counts) for codes, counts, levels in absorbed) - (len(absorbed) - 1) if self.absorb else 0
+        self.rdf = self.n - self.p - (1 if self.intercept else 0) - self.absorbed_df
+        self.resid_var_ = self.sse_ / self.rdf
 
         # Get covariance matrix between coefficients
         self.cov_ = self.resid_var_ * cho_inv(r)
@@ -227,12 +788,19 @@ class LinearModel(Model):
             cols.append("Intercept")
             coef_ = np.append(coef_, y_offset - (X_offsets * coef_).sum())
             cov_coef_intercept = -np.dot(self.cov_, X_offsets)
-            var_intercept = self.resid_var_ / self.n - (X_offsets * cov_coef_intercept).sum()
+            var_intercept = self.resid_var_ / self.total_weight_ - (X_offsets * cov_coef_intercept).sum()
             self.cov_ = np.block([
                 [self.cov_, cov_coef_intercept[:, np.newaxis]],
                 [cov_coef_intercept[np.newaxis, :], var_intercept]
             ])
 
+        # Swap in a robust covariance if requested
+        self.cov_type_ = cov_type
+        self.cov_factor_ = None
+        if cov_type != "nonrobust":
+            self.cov_ = self._robust_cov(X, Xc if self.absorb else None, residuals, cov_type, groups)
+            self.cov_factor_ = _cov_factor(self.cov_)
+
         # Get standard errors (diagonal of the covariance matrix)
         se_coef_ = np.sqrt(np.diagonal(self.cov_))
         
@@ -250,27 +818,141 @@ class LinearModel(Model):
 
         self.coef_ = table["Coefficient"]
         self.se_coef_ = table["SE"]
+        self._publish_snapshot()
+
+        if sample is not None:
+            self.sample_info_ = self._sample_report(info, X_full, y_full, rows, self.weights_, r_sketch)
 
         return table
         
+    def _retain_artifacts(self, X, y, fitted, residuals, q):
+        ''' Keep (or let go of) the full-length training artifacts according to self.retain. '''
+        keep_vectors = self.retain in ("residuals", "all")
+        self._X_train = X if self.retain == "all" else None
+        self._q = q if self.retain == "all" else None
+        self._y_train = y if keep_vectors else None
+        self._fitted = fitted if keep_vectors else None
+        self._residuals = residuals if keep_vectors else None
+        if self.retain == "none":
+            self.training_data = None
+
+    def _check_training_data(self):
+        if self.training_data is None:
+            raise AttributeError("Training data is not available for this model (retain='{}'). "
+                                 "Refit with retain='summary' or higher to use this feature.".format(self.retain))
+
+    def _recompute_artifacts(self):
+        ''' Recompute the training design, response, fitted values and residuals from the training data. '''
+        self._check_training_data()
+        X = self.ex.evaluate(self.training_data, fit=False)
+        y = self.re.evaluate(self.training_data, fit=False).iloc[:, 0]
+        Xc = X - self.X_offsets_ if self.intercept else X
+        fitted = self.y_offset_ + np.dot(Xc, self.coef_[list(X.columns)])
+        if self.absorb:
+            fitted = fitted + self._absorbed_effects(self.training_data)
+        return X, y, fitted, y - fitted
+
+    def _robust_cov(self, X, Xc, residuals, cov_type, groups):
+        ''' Compute a sandwich covariance for the coefficients (in coefficient order, intercept last). '''
+        if self.absorb:
+            D = np.asarray(Xc, dtype=float)
+        else:
+            D = X.to_numpy(dtype=float)
+            if self.intercept:
+                D = np.column_stack([D, np.ones(self.n)])
+        e = np.asarray(residuals, dtype=float)
+        if self.weights_ is not None:
+            root_weights = np.sqrt(self.weights_)
+            D, e = D * root_weights[:, np.newaxis], e * root_weights
+
+        codes = None
+        if cov_type == "cluster":
+            codes, _ = pd.factorize(np.asarray(groups))
+            if len(codes) != self.n:
+                raise ValueError("groups must give a cluster for every training row.")
+
+        bread = self.cov_ / self.resid_var_
+        return _sandwich(D, e, bread, cov_type, codes, self.n - self.rdf)
+
+    def _check_supported(self, feature, allow_weights=False):
+        if self.absorb:
+            raise Exception("Models with absorbed effects do not support {}.".format(feature))
+        if self.weights_ is not None and not allow_weights:
+            raise Exception("Weighted models do not support {}.".format(feature))
+
+    def _absorbed_effects(self, data, fixed_effects=None):
+        ''' Sum the absorbed fixed effects (by default the model's) for each row of data. Levels unseen in 
+        training give NaN. '''
+        fixed_effects = self.fixed_effects_ if fixed_effects is None else fixed_effects
+        total = np.zeros(len(data))
+        for name in self.absorb:
+            total += pd.Series(data[name]).map(fixed_effects[name]).to_numpy(dtype=float)
+        return total
+
+    @property
+    def X_train_(self):
+        ''' The evaluated training design (without intercept), recomputed if it was not retained. '''
+        if self._X_train is not None:
+            return self._X_train
+        return self._recompute_artifacts()[0]
+
+    @property
+    def y_train_(self):
+        ''' The evaluated training response, recomputed if it was not retained. '''
+        if self._y_train is not None:
+            return self._y_train
+        return self._recompute_artifacts()[1]
+
+    @property
+    def fitted_(self):
+        ''' The fitted values on the training data, recomputed if they were not retained. '''
+        if self._fitted is not None:
+            return self._fitted
+        return self._recompute_artifacts()[2]
+
+    @property
+    def residuals_(self):
+        ''' The residuals on the training data, recomputed if they were not retained. '''
+        if self._residuals is not None:
+            return self._residuals
+        return self._recompute_artifacts()[3]
+
+    @property
+    def q_(self):
+        ''' The Q factor of the centered training design, recomputed if it was not retained. '''
+        if self._q is not None:
+            return self._q
+        X = np.asarray(self.X_train_, dtype=float)
+        if self.absorb:
+            within = _group_demean(X, _absorb_groups(self.training_data, self.absorb), self.weights_)[0]
+            if self.weights_ is not None:
+                within *= np.sqrt(self.weights_)[:, np.newaxis]
+            return np.linalg.qr(within)[0]
+        if self.weights_ is not None:
+            return np.linalg.qr(np.sqrt(self.weights_)[:, np.newaxis] * (X - self.X_offsets_))[0]
+        return np.linalg.qr(X - self.X_offsets_)[0]
+
     def likelihood(self, data=None):
         ''' Calculate likelihood for a fitted model on either original data or new data. '''
         return np.exp(self.log_likelihood(data))
 
     def log_likelihood(self, data=None):
-        ''' Calculate a numerically stable log_likelihood for a fitted model on either original data or new data. '''
+        ''' Calculate a numerically stable log_likelihood for a fitted model on either original data or new data. 
+        For a weighted model, new data is given unit weights. '''
 
+        log_weights = 0
         if data is None:
-            residuals = self.residuals_
+            n, sse = self.n, self.sse_
+            if self.weights_ is not None:
+                log_weights = np.log(self.weights_).sum() / 2
         else:
-            y = self.re.evaluate(data)
+            y = self.re.evaluate(data, fit=False)
             y_hat = self.predict(data, for_plot=False, confidence_interval=False, prediction_interval=False)
             residuals = y.iloc[:, 0] - y_hat.iloc[:, 0]
+            n, sse = len(residuals), (residuals ** 2).sum()
 
-        n = len(residuals)
-
-        return (-n / 2 * (np.log(2 * np.pi) + np.log(self.resid_var_)) -
-                (1 / (2 * self.resid_var_)) * (residuals ** 2).sum())
+        return (-n / 2 * (np.log(2 * np.pi) + np.log(self.resid_var_)) + log_weights -
+                (1 / (2 * self.resid_var_)) * sse)
     
     def confidence_intervals(self, alpha=None, conf=None):
         ''' Calculate confidence intervals for the coefficients.
@@ -295,43 +977,196 @@ class LinearModel(Model):
         crit_prob = 1 - (alpha / 2)
             
         lower_bound, upper_bound = _confint(self.coef_, self.se_coef_,
-                                            self.rdf, crit_prob)
+                                            self._inference_df, crit_prob)
         
         return pd.DataFrame({
             "%.1f%%" % (100 * (1 - crit_prob)): lower_bound,
             "%.1f%%" % (100 * crit_prob): upper_bound
         }, index=self.coef_.index)
 
-    def predict(self, data, for_plot=False, confidence_interval=False, prediction_interval=False):
+    def bootstrap(self, n_boot=1000, kind="residual", alpha=0.05, seed=None, chunk_size=None, n_jobs=1):
+        ''' Estimate the sampling distribution of the coefficients by resampling.
+
+        This function assumes that Model.fit() has already been called.
+
+        Arguments:
+            n_boot - An integer number of bootstrap replicates.
+            kind - A str, one of "residual" (resample residuals), "wild" (flip the signs of residuals 
+                with Rademacher weights), or "pairs" (resample whole rows and refit).
+                The residual and wild variants reuse the QR decomposition from fitting, so every batch 
+                of replicates is a single matrix solve.
+            alpha - A float between 0.0 and 1.0 for the non-coverage probability of the percentile intervals.
+            seed - An optional integer seed. Results are reproducible for a given seed regardless of n_jobs.
+            chunk_size - An optional integer number of replicates per batch. By default batches are sized
+                so that the resampled responses stay around 32MB.
+            n_jobs - An integer number of worker processes to use for the pairs bootstrap. The workers
+                attach to a shared memory copy of the design (see LinearModel.share_design).
+
+        Returns:
+            A DataFrame containing the bootstrap standard errors and percentile confidence intervals.
+            The replicates themselves are stored in Model.boot_coefs_.
+        '''
+        self._check_supported("bootstrap")
+        if kind not in ("residual", "wild", "pairs"):
+            raise ValueError("Bootstrap kind must be one of 'residual', 'wild', or 'pairs'.")
+
+        sizes = _batch_sizes(n_boot, self.n, chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        if kind == "pairs":
+            if n_jobs == 1:
+                X, y = np.asarray(self.X_train_[self.snapshot_.columns], dtype=float), np.asarray(self.y_train_, dtype=float)
+                chunks = [_pairs_bootstrap_chunk(X, y, self.intercept, s, size) for s, size in zip(seeds, sizes)]
+            else:
+                with self.share_design() as shared, \
+                     ProcessPoolExecutor(max_workers=n_jobs, initializer=_pairs_worker_init, initargs=(shared.handle,)) as pool:
+                    chunks = list(pool.map(_pairs_worker_chunk, seeds, sizes))
+        else:
+            fitted = np.asarray(self.fitted_, dtype=float)
+            residuals = np.asarray(self.residuals_, dtype=float)
+            if kind == "residual":
+                residuals = residuals - residuals.mean()
+            q = self.q_
+            chunks = []
+            for s, size in zip(seeds, sizes):
+                rng = np.random.default_rng(s)
+                if kind == "residual":
+                    E = residuals[rng.integers(0, self.n, (self.n, size))]
+                else:
+                    E = residuals[:, np.newaxis] * rng.choice([-1.0, 1.0], (self.n, size))
+                chunks.append(_centered_qr_coefs(q, self.r_, fitted[:, np.newaxis] + E,
+                                                 self.X_offsets_, self.intercept))
+
+        coefs = np.hstack(chunks)
+        self.boot_coefs_ = pd.DataFrame(coefs.T, columns=self.coef_.index)
+
+        crit_prob = 1 - (alpha / 2)
+        lower_bound, upper_bound = np.percentile(coefs, [100 * (1 - crit_prob), 100 * crit_prob], axis=1)
+
+        return pd.DataFrame(OrderedDict((
+            ("Coefficient", self.coef_), ("SE", coefs.std(axis=1, ddof=1)),
+            ("%.1f%%" % (100 * (1 - crit_prob)), lower_bound),
+            ("%.1f%%" % (100 * crit_prob), upper_bound)
+        )), index=self.coef_.index)
+
+    def permutation_test(self, term, n_perm=1000, seed=None, chunk_size=None):
+        ''' Test whether a term is needed in the model with a permutation test (Freedman-Lane).
+
+        Residuals of the model without the term are permuted and added back onto its fitted values.
+        The partial F statistic of every permuted response is computed from the stored QR decompositions,
+        one batch of permutations at a time.
+
+        Arguments:
+            term - An Expression (or its str representation) that is a term of the fitted model.
+            n_perm - An integer number of permutations.
+            seed - An optional integer seed.
+            chunk_size - An optional integer number of permutations per batch.
+
+        Returns:
+            A DataFrame containing the degrees of freedom, the observed F statistic, and the permutation p-value.
+        '''
+        self._check_supported("permutation tests")
+        matches = [t for t in self.ex.get_terms() if str(t) == str(term)]
+        if len(matches) == 0:
+            raise KeyError("Term '{}' is not in the model.".format(term))
+        term = matches[0]
+
+        X_train = self.X_train_
+        cols = list(X_train.columns)
+        term_cols = set(term.evaluate(self.training_data.iloc[:1], fit=False).columns)
+        keep = [i for i, col in enumerate(cols) if col not in term_cols]
+        term_df = len(cols) - len(keep)
+        if term_df == 0:
+            raise Exception("Term '{}' contributes no columns to the design, so there is nothing to test.".format(term))
+
+        Xc = np.asarray(X_train, dtype=float)[:, keep] - self.X_offsets_[keep]
+        y = np.asarray(self.y_train_, dtype=float)
+        q_reduced, _ = np.linalg.qr(Xc)
+        yc = y - self.y_offset_
+        fitted_reduced = self.y_offset_ + q_reduced @ (q_reduced.T @ yc)
+        resid_reduced = y - fitted_reduced
+        q_full = self.q_
+
+        def f_stats(Y):
+            if self.intercept:
+                Y = Y - Y.mean(axis=0)
+            total = (Y ** 2).sum(axis=0)
+            sse_full = total - ((q_full.T @ Y) ** 2).sum(axis=0)
+            sse_reduced = total - ((q_reduced.T @ Y) ** 2).sum(axis=0)
+            return ((sse_reduced - sse_full) / term_df) / (sse_full / self.rdf)
+
+        f_obs = f_stats(y[:, np.newaxis])[0]
+
+        sizes = _batch_sizes(n_perm, self.n, chunk_size)
+        exceed = 0
+        for s, size in zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes):
+            rng = np.random.default_rng(s)
+            perms = np.argsort(rng.random((self.n, size)), axis=0)
+            exceed += (f_stats(fitted_reduced[:, np.newaxis] + resid_reduced[perms]) >= f_obs).sum()
+
+        return pd.DataFrame({
+            "DF": [term_df],
+            "F": [f_obs],
+            "p": [(exceed + 1) / (n_perm + 1)]
+        }, index=["- " + str(term)], columns=["DF", "F", "p"])
+
+    def _prediction_rows(self, data, na_action):
+        ''' Apply na_action (see LinearModel.predict) to the data to predict on, with one mask over only the 
+        columns the model uses. '''
+        _check_na_action(na_action, allow_none=True)
+        if na_action is None:
+            return data
+        names = [name for name in data.columns if name in self._required_columns(response=False)]
+        missing, incomplete = _missing_rows(data, names)
+        if not missing.any():
+            return data
+        if na_action == "raise":
+            raise ValueError("{} rows have missing values (in columns {}).".format(missing.sum(), incomplete))
+        if isinstance(data, pd.DataFrame):
+            return data.loc[~missing, names]
+        return data.to_frame(names).loc[~missing]
+
+    def predict(self, data, for_plot=False, confidence_interval=False, prediction_interval=False, na_action=None):
         ''' Predict response values from a fitted Model.
 
         Arguments:
             data - A DataFrame containing the values of the explanatory variables, for which
-                predictions are desired.
+                predictions are desired. A ColumnSource, dict of arrays, pyarrow Table or path (see 
+                salmon.sources) also works, and only the columns the model uses are read.
             for_plot - A boolean indicating if these predictions are computed for the purposes of plotting.
             confidence_interval - If a confidence interval for the mean response is desired, this is 
                 a float between 0.0 and 1.0 indicating the confidence level to use.
             prediction_interval - If a prediction interval is desired, this is 
                 a float between 0.0 and 1.0 indicating the confidence level to use.
+            na_action - An optional str for rows with missing values: "drop" leaves them out (the predictions 
+                keep the index of the remaining rows), and "raise" raises a ValueError. By default rows are 
+                predicted as they are (missing quantitative values give NaN predictions).
 
         Returns:
             A DataFrame containing the predictions and/or intervals.
         '''
-        # Construct the X matrix
-        X = self.ex.evaluate(data, fit=False)
-        if self.intercept:
-            X['Intercept'] = 1
+        # Construct the X matrix from a single snapshot, in case the model is refit while predicting
+        data = self._prediction_rows(as_source(data), na_action)
+        snapshot = self.snapshot_
+        X = self._design(data, snapshot)
 
-        y_vals = np.dot(X, self.coef_)
+        coefs = snapshot.coef
+        if self.intercept:
+            y_vals = X @ coefs[:-1] + coefs[-1]
+        else:
+            y_vals = X @ coefs
+        if self.absorb:
+            y_vals = y_vals + self._absorbed_effects(data, snapshot.fixed_effects)
         predictions = pd.DataFrame({"Predicted " + str(self.re) : y_vals})
             
         if confidence_interval or prediction_interval:
+            groups = self._interval_groups(data, snapshot) if self.absorb else None
             if confidence_interval:
                 alpha = confidence_interval
-                widths = self._confidence_interval_width(X, confidence_interval)
+                widths = self._confidence_interval_width(X, confidence_interval, snapshot, groups)
             else:
                 alpha = prediction_interval
-                widths = self._prediction_interval_width(X, prediction_interval)
+                widths = self._prediction_interval_width(X, prediction_interval, snapshot, groups)
 
             crit_prob = 1 - (alpha / 2)
 
@@ -341,12 +1176,166 @@ class LinearModel(Model):
             predictions[str(round(1 - crit_prob, 5) * 100) + "%"] = lower
             predictions[str(round(crit_prob, 5) * 100) + "%"] = upper
 
+        if na_action == "drop":
+            predictions.index = data.index
         return predictions
     
+    def share_design(self, data=None, backend="shared_memory", path=None):
+        ''' Evaluate the design once into memory that worker processes can attach to by name.
+
+        This function assumes that Model.fit() has already been called. Use the result as a context manager, 
+        pass its handle to workers (e.g. as a process pool initializer argument), and attach with 
+        salmon.attach(handle) to get zero-copy arrays. salmon.fit_columns and salmon.fit_subsets fit on 
+        subsets of the columns.
+
+        Arguments:
+            data - An optional DataFrame to evaluate the design on. Default is the training data.
+            backend - A str, either "shared_memory" or "memmap" (a memory mapped file).
+            path - For the memmap backend, an optional str file path. Default is a temporary file.
+
+        Returns:
+            A SharedDesign object.
+        '''
+        self._check_supported("shared designs", allow_weights=True)
+        if data is None:
+            self._check_training_data()
+        return SharedDesign(self, data, backend, path)
+
+    def compile_predictor(self):
+        ''' Create a CompiledPredictor for low-latency scoring of single rows or small batches.
+
+        This function assumes that Model.fit() has already been called. The predictor takes dicts or 
+        structured arrays and does not depend on pandas when predicting.
+
+        Returns:
+            A CompiledPredictor object.
+        '''
+        self._check_supported("compiled predictors", allow_weights=True)
+        return CompiledPredictor(self)
+
+    def to_python_source(self, function_name="predict"):
+        ''' Generate the source code of a standalone scoring function for the fitted model.
+
+        The generated module depends only on NumPy: coefficients are folded into the column expressions,
+        main effect Categorical terms become lookup arrays, and Transformations are inlined.
+
+        Arguments:
+            function_name - A str name for the generated function.
+
+        Returns:
+            A str of Python source code defining function_name(columns), which takes a mapping of
+            column names to arrays and returns an array of predictions.
+        '''
+        self._check_supported("generated source", allow_weights=True)
+        return _generate_source(self, function_name)
+
+    def to_numpy_function(self, function_name="predict"):
+        ''' Compile the source from LinearModel.to_python_source into a function. '''
+        namespace = dict()
+        exec(compile(self.to_python_source(function_name), "<salmon: {}>".format(self), "exec"), namespace)
+        return namespace[function_name]
+
+    def _publish_snapshot(self):
+        ''' Freeze the fitted Expressions and coefficients for prediction. See FittedSnapshot. '''
+        columns = self.coef_.index[:-1] if self.intercept else self.coef_.index
+        self.snapshot_ = FittedSnapshot(self.ex, self.re, list(columns), self.coef_.to_numpy(copy=True), self.r_,
+                                        self.X_offsets_, self.total_weight_, self.resid_var_, self.rdf,
+                                        self.cov_type_, self.cov_factor_, dict(self.fixed_effects_), self.group_means_)
+
+    def _design(self, data, snapshot=None):
+        ''' Evaluate the explanatory Expression on new data as an array, with columns in the same order 
+        as the coefficients. The intercept column is left out. '''
+        if snapshot is None:
+            snapshot = self.snapshot_
+        return snapshot.explanatory.evaluate(data, fit=False)[snapshot.columns].to_numpy(dtype=float)
+
+    def save(self, path):
+        ''' Save a fitted model for later predictions, without any of its training data.
+
+        Two files are written: path + ".json" holds the fitted Expressions (including learned Categorical
+        levels and Transformation statistics) and summary values, and path + ".npz" holds the coefficients 
+        and their covariance matrix.
+
+        Arguments:
+            path - A str path, without extension, to save the model to.
+        '''
+        self._check_supported("saving", allow_weights=True)
+        spec = {
+            "explanatory": self.ex._to_spec(),
+            "response": self.re._to_spec(),
+            "given_explanatory": self.given_ex._to_spec(),
+            "given_response": self.given_re._to_spec(),
+            "intercept": self.intercept,
+            "columns": list(self.coef_.index),
+            "n": int(self.n),
+            "p": int(self.p),
+            "rdf": int(self.rdf),
+            "total_weight": float(self.total_weight_),
+            "resid_var": float(self.resid_var_),
+            "solver": self.solver_,
+            "approximate": self.approximate_,
+            "cov_type": self.cov_type_,
+            "sse": float(self.sse_),
+            "sst": float(self.sst_)
+        }
+        with open(path + ".json", "w") as f:
+            json.dump(spec, f)
+        np.savez(path + ".npz", coef=np.asarray(self.coef_, dtype=float), cov=np.asarray(self.cov_, dtype=float),
+                 r=self.r_, X_offsets=self.X_offsets_)
+
+    @classmethod
+    def load(cls, path):
+        ''' Load a model saved with LinearModel.save.
+
+        The loaded model supports predictions (with intervals), confidence intervals, and printing. 
+        As no training data is stored, anything that needs it (e.g. plots) is unavailable.
+
+        Arguments:
+            path - A str path, without extension, the model was saved to.
+
+        Returns:
+            A fitted LinearModel object.
+        '''
+        with open(path + ".json") as f:
+            spec = json.load(f)
+        model = cls.__new__(cls)
+        with np.load(path + ".npz") as arrays:
+            coef, cov = arrays["coef"], arrays["cov"]
+            model.r_, model.X_offsets_ = arrays["r"], arrays["X_offsets"]
+
+        model.given_ex = _from_spec(spec["given_explanatory"])
+        model.given_re = _from_spec(spec["given_response"])
+        model.ex = _from_spec(spec["explanatory"])
+        model.re = _from_spec(spec["response"])
+        model.intercept = spec["intercept"]
+        model.absorb, model.fixed_effects_, model.group_means_, model.absorbed_df = [], dict(), None, 0
+        model.weights_, model.sample_info_, model._sample_source = None, None, None
+        model.data_index_, model.dropped_rows_ = None, None
+        model.schema = None
+        model.training_data = None
+        model.retain = "none"
+        model._X_train, model._y_train, model._fitted, model._residuals, model._q = None, None, None, None, None
+        model.categorical_levels = dict()
+        model.sse_, model.sst_ = spec["sse"], spec["sst"]
+        model.n, model.p, model.rdf = spec["n"], spec["p"], spec["rdf"]
+        model.total_weight_ = spec["total_weight"]
+        model.resid_var_ = spec["resid_var"]
+        model.solver_, model.approximate_ = spec["solver"], spec["approximate"]
+        model.cov_ = cov
+        model.cov_type_ = spec["cov_type"]
+        model.cov_factor_ = _cov_factor(cov) if model.cov_type_ != "nonrobust" else None
+
+        se_coef = np.sqrt(np.diagonal(cov))
+        model.t_ = coef / se_coef
+        model.p_ = 2 * stats.t.cdf(-abs(model.t_), model.rdf)
+        model.coef_ = pd.Series(coef, index=spec["columns"], name="Coefficient")
+        model.se_coef_ = pd.Series(se_coef, index=spec["columns"], name="SE")
+        model._publish_snapshot()
+        return model
+
     def get_sse(self):
         ''' Get the SSE of a fitted model. '''
-        sse = ((self.y_train_ - self.fitted_) ** 2).sum()
-        return sse
+        return self.sse_
         
     def get_ssr(self):
         ''' Get the SSR of a fitted model. '''
@@ -355,8 +1344,7 @@ class LinearModel(Model):
     
     def get_sst(self):
         ''' Get the SST of a fitted model. '''
-        sst = ((self.y_train_ - self.y_train_.mean()) ** 2).sum()
-        return sst
+        return self.sst_
     
     def r_squared(self, X = None, y = None, adjusted = False, **kwargs):
         ''' Calculate the (adjusted) R^2 value of the model.
@@ -372,21 +1360,27 @@ class LinearModel(Model):
         '''
         # Allow interfacing with sklearn's cross fold validation
         #self.fit(X, y)
-        if X is None:
-            X = self.training_data
-        if y is None:
-            y = self.y_train_
+        if X is None and y is None:
+            # Training data, so use the sums of squares kept from fitting
+            n, sse, ssto = self.n, self.get_sse(), self.get_sst()
+        else:
+            if X is None:
+                self._check_training_data()
+                X = self.training_data
+            if y is None:
+                y = self.y_train_
 
-        pred = self.predict(X)
-        sse = ((y - pred.iloc[:,0]) ** 2).sum()
-        ssto = ((y - y.mean()) ** 2).sum()
+            pred = self.predict(X)
+            sse = ((y.values - pred.iloc[:,0].values) ** 2).sum()
+            ssto = ((y - y.mean()) ** 2).sum()
+            n = len(y)
 
         if adjusted:
+            numerator = sse / (n - (self.n - self.rdf))
+            denominator = ssto / (n - 1)
+        else:
             numerator = sse
             denominator = ssto
-        else:
-            numerator = sse / (len(y) - len(self.X_train_.columns) - 2)
-            denominator = ssto / (len(y) - 1)
             
         return 1 - numerator / denominator 
 
@@ -394,22 +1388,210 @@ class LinearModel(Model):
         ''' Wrapper for sklearn api for cross fold validation. See LinearModel.r_squared. '''
         return self.r_squared(X, y, adjusted, **kwargs)
 
-    def _prediction_interval_width(self, X_new, alpha = 0.05):
+    def influence(self, top_k=None):
+        ''' Compute leverage and influence diagnostics for each training row.
+
+        Everything is computed from the R factor of the fit, in blocks of rows, so memory stays proportional
+        to the size of the design rather than forming the n x n hat matrix. 
+
+        Arguments:
+            top_k - An optional int. If given, only the top_k rows with the largest Cook's distance are returned 
+                (found with a partial sort), and DFBETAS are only computed for those rows.
+
+        Returns:
+            A DataFrame indexed like the training data with the leverage (hat diagonal), externally studentized 
+            residual, Cook's distance, DFFITS, and a DFBETAS column for each coefficient.
+        '''
+        self._check_supported("influence diagnostics", allow_weights=True)
+        X = np.asarray(self.X_train_, dtype=float)
+        residuals = np.asarray(self.residuals_, dtype=float)
+        index = self.y_train_.index
+        root_weights = np.ones(self.n) if self.weights_ is None else np.sqrt(self.weights_)
+        total_weight = self.total_weight_
+
+        # Everything below only needs O(n) vectors, except for DFBETAS
+        e = root_weights * residuals
+        leverages = root_weights ** 2 * _leverage_scores(self.r_, X, self.X_offsets_)
+        if self.intercept:
+            leverages += root_weights ** 2 / total_weight
+        k = self.n - self.rdf
+        internal = e / np.sqrt(self.resid_var_ * (1 - leverages))
+        deleted_var = (self.sse_ - e ** 2 / (1 - leverages)) / (self.rdf - 1)
+        external = e / np.sqrt(deleted_var * (1 - leverages))
+        cooks = internal ** 2 * leverages / (k * (1 - leverages))
+        dffits = external * np.sqrt(leverages / (1 - leverages))
+
+        if top_k is not None and top_k < self.n:
+            rows = np.argpartition(-cooks, top_k)[:top_k]
+            rows = rows[np.argsort(-cooks[rows], kind="stable")]
+        else:
+            rows = np.arange(self.n)
+
+        # DFBETAS_ij = [(X'X)^-1 x_i]_j e_i / (1 - h_i) / (s_(i) sqrt([(X'X)^-1]_jj)), with the intercept column included
+        bread = cho_inv(self.r_)
+        if self.intercept:
+            offsets_bread = bread @ self.X_offsets_
+            bread = np.block([
+                [bread, -offsets_bread[:, np.newaxis]],
+                [-offsets_bread[np.newaxis, :], 1 / total_weight + self.X_offsets_ @ offsets_bread]
+            ])
+        scale = np.sqrt(np.diagonal(bread))
+        dfbetas = np.empty((len(rows), len(self.coef_)))
+        block_rows = max(1, _INTERVAL_BLOCK_ELEMENTS // max(len(self.coef_), 1))
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            design = X[block]
+            if self.intercept:
+                design = np.column_stack([design, np.ones(len(block))])
+            changes = (design @ bread) * (root_weights[block] * e[block] / (1 - leverages[block]))[:, np.newaxis]
+            dfbetas[start:start + block_rows] = changes / (np.sqrt(deleted_var[block])[:, np.newaxis] * scale)
+
+        table = pd.DataFrame(OrderedDict((
+            ("Leverage", leverages[rows]),
+            ("Studentized Residual", external[rows]),
+            ("Cook's Distance", cooks[rows]),
+            ("DFFITS", dffits[rows])
+        )), index=index[rows])
+        for j, column in enumerate(self.coef_.index):
+            table["DFBETAS " + str(column)] = dfbetas[:, j]
+        return table
+
+    def collinearity(self, n_directions=3):
+        ''' Diagnose collinearity among the columns of the (centered) design.
+
+        Everything comes from a single eigendecomposition of the correlation matrix of the columns, which is
+        built from the R factor of the fit rather than from p auxiliary regressions.
+
+        Arguments:
+            n_directions - An int number of the most nearly dependent directions to report.
+
+        Returns:
+            A dict containing:
+                "vif" - A Series of variance inflation factors for each column.
+                "gvif" - A DataFrame of generalized variance inflation factors for each term, along with its 
+                    degrees of freedom and GVIF^(1/(2 DF)), which is comparable to the square root of a VIF.
+                "condition_number" - The condition number of the correlation matrix of the columns.
+                "directions" - A DataFrame with the smallest eigenvalues of the correlation matrix, their 
+                    condition indices, and the loadings of each column on the corresponding eigenvectors.
+        '''
+        columns = [column for column in self.coef_.index if column != "Intercept" or not self.intercept]
+        gram = self.r_.T @ self.r_
+        scale = np.sqrt(np.diagonal(gram))
+        correlation = gram / np.outer(scale, scale)
+        eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+        eigenvalues = np.clip(eigenvalues, 0, None)
+        with np.errstate(divide="ignore"):
+            inverse = (eigenvectors / eigenvalues) @ eigenvectors.T
+            condition_number = np.sqrt(eigenvalues[-1] / eigenvalues[0]) if len(eigenvalues) else 1.0
+
+        vif = pd.Series(np.diagonal(inverse), index=columns, name="VIF")
+
+        # GVIF = det(R_SS) det(R^-1_SS) for the block of a term's columns S
+        positions = {column: i for i, column in enumerate(columns)}
+        terms, dofs, gvifs = [], [], []
+        for term in self.ex.get_terms():
+            span = [positions[name] for name, func in term._compile() if name in positions]
+            if len(span) == 0:
+                continue
+            block = np.ix_(span, span)
+            with np.errstate(invalid="ignore"):
+                gvif = np.linalg.det(correlation[block]) * np.linalg.det(inverse[block])
+            terms.append(str(term))
+            dofs.append(len(span))
+            gvifs.append(gvif)
+        gvifs, dofs = np.array(gvifs, dtype=float), np.array(dofs)
+        gvif = pd.DataFrame(OrderedDict((
+            ("DF", dofs), ("GVIF", gvifs), ("GVIF^(1/(2*DF))", gvifs ** (1 / (2 * dofs)))
+        )), index=terms)
+
+        worst = slice(0, min(n_directions, len(eigenvalues)))
+        with np.errstate(divide="ignore"):
+            indices = np.sqrt(eigenvalues[-1] / eigenvalues[worst])
+        directions = pd.DataFrame(eigenvectors[:, worst].T, columns=columns)
+        directions.insert(0, "Condition Index", indices)
+        directions.insert(0, "Eigenvalue", eigenvalues[worst])
+
+        return dict(
+            vif=vif,
+            gvif=gvif,
+            condition_number=condition_number,
+            directions=directions
+        )
+
+    def _leverages(self, X_new, snapshot=None):
+        ''' Helper function for calculating x (X'X)^-1 x' for each row of new (intercept free) design rows.
+
+        These are computed as squared norms of R^-T (x - offsets) with the R factor of the centered training
+        design, in blocks of rows so memory stays proportional to the block size rather than the data.
+        The fitted state is read from snapshot (default is the model's current FittedSnapshot).
+        '''
+        snapshot = self.snapshot_ if snapshot is None else snapshot
+        leverages = _leverage_scores(snapshot.r, X_new, snapshot.X_offsets)
+        if self.intercept:
+            leverages += 1 / snapshot.total_weight
+        return leverages
+
+    def _interval_groups(self, data, snapshot):
+        ''' The position of each row's level of the absorbed factor among the training levels (-1 if unseen). '''
+        if snapshot.group_means is None:
+            raise Exception("Intervals are only available for models with a single absorbed factor.")
+        if snapshot.cov_type != "nonrobust":
+            raise Exception("Intervals for a model with absorbed effects are only available with cov_type='nonrobust'.")
+        return snapshot.group_means[0].get_indexer(pd.Series(data[self.absorb[0]]))
+
+    def _mean_variances(self, X_new, snapshot=None, groups=None):
+        ''' Helper function for calculating the variance of the estimated mean response at new design rows.
+
+        With a robust covariance these are the squared norms of L' x, for a factor L L' of the covariance, 
+        computed in blocks of rows like the leverages.
+
+        For a model with an absorbed factor, groups gives the position of each row's level (see _interval_groups).
+        The estimated effect of level g is the mean response of g less x_g' b, for the design means x_g of the 
+        level, so the estimated mean response is (x - x_g)' b plus a mean that is uncorrelated with b. Its
+        variance is (x - x_g)' Cov(b) (x - x_g) + s^2 / w_g, with w_g the total weight of the level, which is 
+        what the model with dummy columns for the factor gives. Unseen levels give NaN. A robust covariance would
+        need the training residuals for the level's part, so intervals are only available with cov_type="nonrobust".
+        '''
+        snapshot = self.snapshot_ if snapshot is None else snapshot
+        if self.absorb:
+            if groups is None:
+                raise Exception("Intervals for a model with absorbed effects need the level of each new row.")
+            _, means, totals = snapshot.group_means
+            centered = X_new - means[groups]
+            variances = snapshot.resid_var * (_leverage_scores(snapshot.r, centered, np.zeros(X_new.shape[1])) + 1 / totals[groups])
+            return np.where(groups >= 0, variances, np.nan)
+        if snapshot.cov_type == "nonrobust":
+            return snapshot.resid_var * self._leverages(X_new, snapshot)
+        n_new, p = X_new.shape
+        variances = np.zeros(n_new)
+        block_rows = max(1, _INTERVAL_BLOCK_ELEMENTS // max(p, 1))
+        for start in range(0, n_new, block_rows):
+            block = X_new[start:start + block_rows]
+            if self.intercept:
+                block = np.column_stack([block, np.ones(len(block))])
+            z = block @ snapshot.cov_factor
+            variances[start:start + block_rows] = np.einsum('ij,ij->i', z, z)
+        return variances
+
+    def _prediction_interval_width(self, X_new, alpha = 0.05, snapshot = None, groups = None):
         ''' Helper function for calculating prediction interval widths. '''
-        mse = self.get_sse() / self.rdf
-        s_yhat_squared = (X_new.dot(self.cov_) * X_new).sum(axis = 1)
+        snapshot = self.snapshot_ if snapshot is None else snapshot
+        mse = snapshot.resid_var
+        s_yhat_squared = self._mean_variances(X_new, snapshot, groups)
         s_pred_squared = mse + s_yhat_squared
 
-        t_crit = stats.t.ppf(1 - (alpha / 2), self.rdf)
+        t_crit = _t_crit(1 - (alpha / 2), snapshot.rdf)
 
         return t_crit * (s_pred_squared ** 0.5)
 
-    def _confidence_interval_width(self, X_new, alpha = 0.05):
+    def _confidence_interval_width(self, X_new, alpha = 0.05, snapshot = None, groups = None):
         ''' Helper function for calculating confidence interval widths. '''
-        _, p = X_new.shape
-        s_yhat_squared = (X_new.dot(self.cov_) * X_new).sum(axis = 1)
-        #t_crit = stats.t.ppf(1 - (alpha / 2), n-p)
-        W_crit_squared = p * stats.f.ppf(1 - (alpha / 2), p, self.rdf)
+        snapshot = self.snapshot_ if snapshot is None else snapshot
+        p = len(snapshot.coef)
+        if snapshot.group_means is not None:
+            p += len(snapshot.group_means[0]) # The effect of each absorbed level is estimated too
+        s_yhat_squared = self._mean_variances(X_new, snapshot, groups)
+        W_crit_squared = p * _f_crit(1 - (alpha / 2), p, snapshot.rdf)
         return (W_crit_squared ** 0.5) * (s_yhat_squared ** 0.5)
         
     def plot(
@@ -440,6 +1622,7 @@ class LinearModel(Model):
         '''
         if confidence_band and prediction_band:
             raise Exception("Only one of {confidence_band, prediction_band} may be set to True at a time.")
+        self._check_training_data()
 
         terms = self.ex.reduce()
                         
@@ -526,7 +1709,7 @@ class LinearModel(Model):
 
         plot_objs['x'] = {'name': 'index'}
 
-        points["<Y_RESIDS_TO_PLOT>"] = self.re.evaluate(points)
+        points["<Y_RESIDS_TO_PLOT>"] = self.re.evaluate(points, fit=False)
         if original_y_space:
             points["<Y_RESIDS_TO_PLOT>"] = self.re.untransform(points["<Y_RESIDS_TO_PLOT>"]) # Inefficient due to transforming, then untransforming. Need to refactor later.
 
@@ -632,9 +1815,7 @@ class LinearModel(Model):
     def _plot_band(self, line_x, y_vals, color, original_y_space, plot_objs, use_confidence = False, alpha = 0.05): # By default will plot prediction bands
         ''' A helper function to plot the confidence or prediction bands for a model. '''
         x_name = plot_objs['x']['name']
-        X_new = self.ex.evaluate(line_x, fit = False)
-        if self.intercept:
-            X_new['Intercept'] = 1
+        X_new = self._design(line_x)
 
         if use_confidence:
             widths = self._confidence_interval_width(X_new, alpha)
@@ -743,6 +1924,7 @@ class LinearModel(Model):
             A tuple containing the matplotlib (figure, list of axes) for the partial plots.
         '''
         #terms = self.ex.flatten(separate_interactions = False)
+        self._check_training_data()
         terms = self.ex.get_terms()
         fig, axs = plt.subplots(1, len(terms), **kwargs)
 
@@ -754,8 +1936,8 @@ class LinearModel(Model):
             yaxis = LinearModel(sans_xi, self.re)
             xaxis = LinearModel(sans_xi, xi)
             
-            yaxis.fit(self.training_data)
-            xaxis.fit(self.training_data)
+            yaxis.fit(self.training_data, schema=self.schema)
+            xaxis.fit(self.training_data, schema=self.schema)
             
             ax.scatter(xaxis.residuals_, yaxis.residuals_, alpha = alpha)
             ax.set_title("Leverage Plot for " + str(xi))
@@ -0,0 +1,220 @@
+import numpy as np
+import scipy.stats as stats
+
+from .expression import Categorical, Combination, Constant, Interaction, Quantitative, TransVar
+
+
+def _sortable(levels):
+    ''' Lookup tables rely on np.searchsorted, so the levels must have a consistent order. '''
+    try:
+        sorted(levels)
+        return True
+    except TypeError:
+        return False
+
+
+def _one_hot(term, encoders):
+    ''' Compile a Categorical into a function giving its (n x k) indicator columns with one table lookup.
+    Values that are not among the levels get a row of zeros, like the baseline. A Categorical used by several 
+    terms (e.g. a main effect and an Interaction) is looked up once per request, through the shared memo. '''
+    key = (term.name, tuple(term.levels), tuple(term.baseline))
+    if key in encoders:
+        return encoders[key]
+    columns = [level for level in term.levels if level not in term.baseline]
+    levels = np.array(sorted(term.levels))
+    table = np.zeros((len(levels) + 1, len(columns)))
+    for j, level in enumerate(columns):
+        table[np.flatnonzero(levels == level), j] = 1
+    name, last = term.name, len(levels) - 1
+
+    def block(columns, memo):
+        if key not in memo:
+            values = columns[name]
+            # ndarray methods and ufuncs skip NumPy's function dispatch, which dominates for a single row
+            positions = np.minimum(levels.searchsorted(values), last)
+            positions[levels[positions] != values] = len(levels)
+            memo[key] = table.take(positions, axis=0)
+        return memo[key]
+
+    encoders[key] = block
+    return block
+
+
+def _summed(term, encoders):
+    ''' Compile the sum of a term's columns (what a TransVar transforms), adding up any Constants once. '''
+    terms = list(term.terms) if isinstance(term, Combination) else [term]
+    offset = sum(part.scale for part in terms if isinstance(part, Constant))
+    parts = []
+    for part in terms:
+        if isinstance(part, Quantitative):
+            parts.append(_quantitative(part))
+        elif not isinstance(part, Constant):
+            block = _block(part, encoders)[1]
+            parts.append(lambda columns, memo, block=block: block(columns, memo).sum(axis=1))
+
+    def summed(columns, memo):
+        values = offset
+        for part in parts:
+            values = values + part(columns, memo)
+        return values
+
+    return summed
+
+
+def _quantitative(term):
+    ''' Compile a Quantitative variable into a function reading its (scaled) column. '''
+    name, scale = term.name, term.scale
+    if scale == 1:
+        return lambda columns, memo: columns[name]
+    return lambda columns, memo: scale * columns[name]
+
+
+def _block(term, encoders):
+    ''' Compile a term into a function giving all of its design columns at once, as an (n x k) array.
+
+    Quantitative variables are read directly, Categoricals become table lookups, Interactions of those
+    are products of their factors' blocks, Transformations apply to their summed inner block and Combinations
+    join their terms' blocks. Anything else stacks the term's compiled column functions.
+
+    Returns:
+        A tuple of the column names and the function, which takes the columns and a per-request memo dict.
+    '''
+    compiled = term._compile()
+    names = [name for name, _ in compiled]
+    if isinstance(term, Quantitative):
+        column = _quantitative(term)
+        return names, lambda columns, memo: column(columns, memo).reshape(-1, 1)
+    if isinstance(term, Categorical) and _sortable(term.levels):
+        return names, _one_hot(term, encoders)
+    if isinstance(term, Interaction) and all(isinstance(factor, Quantitative) or 
+                                             (isinstance(factor, Categorical) and _sortable(factor.levels))
+                                             for factor in term.terms):
+        factors = [_block(factor, encoders)[1] for factor in term._sorted_terms()]
+
+        def product(columns, memo):
+            values = factors[0](columns, memo)
+            for factor in factors[1:]:
+                other = factor(columns, memo)
+                # Same column order as Interaction._compile: earlier factors vary slowest
+                values = (values[:, :, np.newaxis] * other[:, np.newaxis, :]).reshape(len(values), -1)
+            return values
+
+        return names, product
+    if isinstance(term, TransVar):
+        values, scale = _summed(term.var, encoders), term.scale
+        transformation = term.transformation.copy()
+
+        def transformed(columns, memo):
+            result = transformation.transform(values(columns, memo), training=False)
+            return (result if scale == 1 else scale * result).reshape(-1, 1)
+
+        return names, transformed
+    if isinstance(term, Combination) and not any(isinstance(part, Constant) for part in term.terms):
+        blocks = [_block(part, encoders)[1] for part in term.terms]
+        return names, lambda columns, memo: np.concatenate([block(columns, memo) for block in blocks], axis=1)
+    funcs = [func for _, func in compiled]
+    if len(funcs) == 1:
+        func = funcs[0]
+        return names, lambda columns, memo: np.reshape(func(columns), (-1, 1))
+    return names, lambda columns, memo: np.column_stack([func(columns) for func in funcs])
+
+
+class CompiledPredictor():
+    ''' A lightweight predictor for a fitted LinearModel, meant for scoring single rows or small batches.
+
+    Column functions, coefficients, and categorical lookup tables are all resolved once at construction,
+    so predicting involves no pandas objects and no Expression evaluation. Each request builds its design
+    rows once, and the predictions (one dot product) and any interval widths are both computed from them.
+    '''
+
+    def __init__(self, model):
+        ''' Create a CompiledPredictor object. Usually done through LinearModel.compile_predictor().
+
+        Arguments:
+            model - A LinearModel that has been fit on some data.
+        '''
+        coefs = model.coef_
+        self.response_name = str(model.re)
+
+        terms = model.ex.reduce()
+        self.names = sorted(var.name for var in terms["Q"] | terms["C"])
+
+        # The design is laid out term by term (intercept last), and the coefficients and their covariance 
+        # are permuted to match once here, so each request only concatenates the terms' blocks
+        encoders = dict()
+        self.blocks, names = [], []
+        for term in model.ex.get_terms():
+            term_names, block = _block(term, encoders)
+            if len(term_names) > 0:
+                self.blocks.append(block)
+                names.extend(term_names)
+        if model.intercept:
+            names.append("Intercept")
+        order = coefs.index.get_indexer(names)
+        self.coef = coefs.to_numpy(dtype=float)[order]
+        self.cov = np.asarray(model.cov_)[np.ix_(order, order)]
+        self.resid_var = model.resid_var_
+        self.rdf = model.rdf
+        self.model_intercept = model.intercept
+
+        self._crit_values = dict()
+
+    def _columns(self, data):
+        ''' Pull the needed variables out of a dict, structured array, or DataFrame as 1D arrays. '''
+        return {name: np.array(data[name], copy=False, ndmin=1) for name in self.names}
+
+    def _design(self, columns):
+        ''' Build the (n x p) design matrix (in the permuted coefficient order), including the intercept column 
+        if applicable. '''
+        n = len(columns[self.names[0]]) if self.names else 1
+        memo = dict()
+        blocks = [block(columns, memo) for block in self.blocks]
+        if self.model_intercept:
+            blocks.append(np.ones((n, 1)))
+        return np.concatenate(blocks, axis=1) if blocks else np.empty((n, 0))
+
+    def _crit_value(self, alpha, kind):
+        ''' Critical values only depend on alpha, so they are computed once per predictor. '''
+        key = (alpha, kind)
+        if key not in self._crit_values:
+            crit_prob = 1 - (alpha / 2)
+            if kind == "prediction":
+                self._crit_values[key] = stats.t.ppf(crit_prob, self.rdf)
+            else:
+                p = self.cov.shape[0]
+                self._crit_values[key] = (p * stats.f.ppf(crit_prob, p, self.rdf)) ** 0.5
+        return self._crit_values[key]
+
+    def predict(self, data, confidence_interval=False, prediction_interval=False):
+        ''' Predict response values.
+
+        Arguments:
+            data - A dict mapping variable names to scalars or arrays, a structured array, or a DataFrame.
+            confidence_interval - If a confidence interval for the mean response is desired, this is
+                a float between 0.0 and 1.0 indicating the non-coverage probability to use.
+            prediction_interval - If a prediction interval is desired, this is
+                a float between 0.0 and 1.0 indicating the non-coverage probability to use.
+
+        Returns:
+            An array of predictions. If an interval is requested, a tuple of (predictions, lower, upper) arrays.
+        '''
+        X = self._design(self._columns(data))
+        y_vals = X @ self.coef
+
+        if not (confidence_interval or prediction_interval):
+            return y_vals
+
+        widths = self._widths(X, confidence_interval, prediction_interval)
+        return y_vals, y_vals - widths, y_vals + widths
+
+    def interval_widths(self, data, confidence_interval=False, prediction_interval=False):
+        ''' Compute half-widths of confidence or prediction intervals. See CompiledPredictor.predict. '''
+        return self._widths(self._design(self._columns(data)), confidence_interval, prediction_interval)
+
+    def _widths(self, X, confidence_interval, prediction_interval):
+        s_yhat_squared = ((X @ self.cov) * X).sum(axis=1)
+
+        if confidence_interval:
+            return self._crit_value(confidence_interval, "confidence") * (s_yhat_squared ** 0.5)
+        else:
+            return self._crit_value(prediction_interval, "prediction") * ((self.resid_var + s_yhat_squared) ** 0.5)
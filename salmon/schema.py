@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from collections import OrderedDict, namedtuple
+
+
+def _is_quantitative(dtype):
+    ''' Whether a column of this dtype is interpreted as a Quantitative variable (otherwise it is Categorical). '''
+    return 'float' in dtype.name or 'int' in dtype.name
+
+
+class ColumnSchema(namedtuple("ColumnSchema", ["kind", "levels", "baseline"])):
+    ''' The kind of a column ("Q" for Quantitative or "C" for Categorical) and, for Categorical columns, its
+    levels and baseline levels (None to learn them when fitting). '''
+    __slots__ = ()
+
+
+class Schema():
+    ''' The kind of every column of a table, and the levels and baseline of its categorical columns.
+
+    A Schema is inferred once from a DataFrame (Schema.infer) or declared explicitly, and then given to
+    LinearModel.fit. Interpreting Vars and learning Categorical levels become lookups in the schema rather
+    than scans of the data, which matters when a model is refit many times (stepwise, anova, partial plots),
+    and every model fit with the same schema encodes each categorical column with the same columns.
+    '''
+
+    def __init__(self, columns=None, baselines=None):
+        ''' Create a Schema object.
+
+        Arguments:
+            columns - A dict mapping column names to "Q" (Quantitative), "C" (Categorical, with levels learned
+                when fitting), or a list of the levels of a Categorical column.
+            baselines - An optional dict mapping Categorical column names to a baseline level (or a list
+                of levels). Default is the first of the listed levels.
+        '''
+        baselines = dict() if baselines is None else baselines
+        self.columns = OrderedDict()
+        for name, kind in (columns or dict()).items():
+            if isinstance(kind, ColumnSchema):
+                self.columns[name] = kind
+            elif kind == "Q":
+                self.columns[name] = ColumnSchema("Q", None, None)
+            elif kind == "C":
+                self.columns[name] = ColumnSchema("C", None, None)
+            else:
+                levels = list(kind)
+                if len(levels) == 0:
+                    raise ValueError("Categorical column '{}' must have at least one level.".format(name))
+                baseline = baselines.get(name, levels[0])
+                if isinstance(baseline, (list, tuple, set)):
+                    baseline = list(baseline)
+                else:
+                    baseline = [baseline]
+                self.columns[name] = ColumnSchema("C", levels, baseline)
+
+    @classmethod
+    def infer(cls, data, columns=None):
+        ''' Infer a Schema from one pass over the columns of a DataFrame, with the same rules as Var.interpret:
+        numeric columns are Quantitative, and everything else is Categorical with its sorted (non-missing)
+        values as levels and the first of them as the baseline.
+
+        Arguments:
+            data - A DataFrame (or ColumnSource).
+            columns - An optional list of the column names to include. Default is all of them.
+
+        Returns:
+            A Schema object.
+        '''
+        names = list(data.columns) if columns is None else list(columns)
+        schema = cls()
+        for name in names:
+            column = data[name]
+            if _is_quantitative(column.dtype):
+                schema.columns[name] = ColumnSchema("Q", None, None)
+            else:
+                levels = np.asarray(column.dropna().unique())
+                levels.sort()
+                schema.columns[name] = ColumnSchema("C", list(levels), list(levels[:1]))
+        return schema
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            raise KeyError("Column '{}' is not in the schema. The schema has columns: {}".format(name, list(self.columns)))
+        return self.columns[name]
+
+    def kind(self, name):
+        ''' "Q" if the column is Quantitative, "C" if it is Categorical. '''
+        return self[name].kind
+
+    def __str__(self):
+        return str(self.to_frame())
+
+    def to_frame(self):
+        ''' Summarize the schema as a DataFrame with a row for each column. '''
+        return pd.DataFrame({
+            "Kind": [column.kind for column in self.columns.values()],
+            "Levels": [column.levels for column in self.columns.values()],
+            "Baseline": [column.baseline for column in self.columns.values()]
+        }, index=list(self.columns), columns=["Kind", "Levels", "Baseline"])
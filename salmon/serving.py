@@ -0,0 +1,232 @@
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BatchingPredictor():
+    ''' An asyncio front-end that scores concurrent single-row requests with one vectorized predict.
+
+    Requests that arrive while a batch is being collected (up to max_batch rows, waiting at most
+    max_delay_ms after the first one) or while the previous batch is being scored are predicted together
+    on a worker thread, and the results are fanned back out to the waiting callers. As predictions read
+    a frozen snapshot of the fitted model, several predictors (or worker threads) can share one model.
+    '''
+
+    def __init__(self, model, max_batch=256, max_delay_ms=2.0, executor=None, **predict_options):
+        ''' Create a BatchingPredictor object.
+
+        Arguments:
+            model - A Model that has been fit on some data.
+            max_batch - An int maximum number of rows scored in one call to predict.
+            max_delay_ms - A float number of milliseconds to wait for more requests after the first
+                request of a batch arrives. 0 only batches requests that are already waiting.
+            executor - An optional concurrent.futures Executor to score batches on. By default a
+                single worker thread owned by the predictor is used.
+            predict_options - Keyword arguments for model.predict, e.g. confidence_interval=0.05.
+        '''
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1.")
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay_ms = max_delay_ms
+        self.predict_options = predict_options
+        self._owns_executor = executor is None
+        self._executor = ThreadPoolExecutor(max_workers=1) if executor is None else executor
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+        self.requests_ = 0
+        self.batches_ = 0
+        self.max_queue_depth_ = 0
+        self.batch_sizes_ = deque(maxlen=1000)
+
+    def _start(self):
+        ''' Start (or restart, on a new event loop) the task that collects and scores batches. '''
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def predict(self, row):
+        ''' Predict the response for a single row.
+
+        Arguments:
+            row - A dict (or Series) mapping variable names to values.
+
+        Returns:
+            A float prediction, or a dict of column name to value if intervals were requested.
+        '''
+        self._start()
+        future = self._loop.create_future()
+        self._queue.put_nowait((row, future))
+        self.requests_ += 1
+        self.max_queue_depth_ = max(self.max_queue_depth_, self._queue.qsize())
+        return await future
+
+    async def _collect(self):
+        ''' Wait for a request, then gather more until the batch is full or the delay runs out. '''
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_delay_ms / 1000
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            rows = [row for row, future in batch]
+            self.batches_ += 1
+            self.batch_sizes_.append(len(rows))
+            results = await self._loop.run_in_executor(self._executor, self._predict_rows, rows)
+            for (row, future), result in zip(batch, results):
+                if future.done():
+                    continue # The caller gave up waiting
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _predict_rows(self, rows):
+        ''' Score a batch on the worker thread. If the batch fails, rows are retried one at a time so
+        a single bad row only fails its own request. '''
+        try:
+            return self._unpack(self.model.predict(pd.DataFrame(rows), **self.predict_options))
+        except Exception as e:
+            if len(rows) == 1:
+                return [e]
+            return [self._predict_rows([row])[0] for row in rows]
+
+    def _unpack(self, predictions):
+        if predictions.shape[1] == 1:
+            return predictions.iloc[:, 0].tolist()
+        return predictions.to_dict(orient="records")
+
+    @property
+    def queue_depth(self):
+        ''' The number of requests waiting for a batch. '''
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def metrics(self):
+        ''' Summarize the requests and batches scored so far.
+
+        Returns:
+            A Series with the number of requests and batches, the current and maximum queue depths, and
+            the mean, median and maximum sizes of the (up to 1000) most recent batches.
+        '''
+        sizes = np.array(self.batch_sizes_) if len(self.batch_sizes_) else np.zeros(1)
+        return pd.Series({
+            "Requests": self.requests_,
+            "Batches": self.batches_,
+            "Queue depth": self.queue_depth,
+            "Max queue depth": self.max_queue_depth_,
+            "Mean batch size": sizes.mean(),
+            "Median batch size": np.median(sizes),
+            "Max batch size": sizes.max()
+        }, name="BatchingPredictor")
+
+    async def close(self):
+        ''' Stop collecting batches, and shut down the worker thread if the predictor created it. '''
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def unbatched_predictor(model, executor=None, **predict_options):
+    ''' An async function that scores each request with its own call to model.predict on a worker thread,
+    as a baseline for BatchingPredictor in load tests.
+
+    Arguments:
+        model - A Model that has been fit on some data.
+        executor - An optional concurrent.futures Executor. By default the event loop's executor is used.
+        predict_options - Keyword arguments for model.predict.
+
+    Returns:
+        An async function taking a single row.
+    '''
+    async def predict(row):
+        loop = asyncio.get_running_loop()
+        predictions = await loop.run_in_executor(executor, lambda: model.predict(pd.DataFrame([row]), **predict_options))
+        return predictions.iloc[0, 0] if predictions.shape[1] == 1 else predictions.iloc[0].to_dict()
+    return predict
+
+
+async def generate_load(predict, rows, n_requests=10000, concurrency=100, rate=None):
+    ''' A synthetic load generator for prediction front-ends.
+
+    Arguments:
+        predict - An async function taking a single row, e.g. BatchingPredictor.predict.
+        rows - A DataFrame (or list of dicts) of rows to cycle through as requests.
+        n_requests - An int total number of requests.
+        concurrency - An int number of clients, each sending its next request when the last one is answered.
+        rate - An optional float target of requests per second (open loop, with exponential gaps between
+            requests) instead of closed loop clients. concurrency then caps the requests in flight.
+
+    Returns:
+        A Series with the throughput (requests per second), the number of errors, and latency percentiles in milliseconds.
+    '''
+    if isinstance(rows, pd.DataFrame):
+        rows = rows.to_dict(orient="records")
+    latencies = np.empty(n_requests)
+    errors = 0
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def request(i):
+        nonlocal errors
+        async with in_flight:
+            start = time.perf_counter()
+            try:
+                await predict(rows[i % len(rows)])
+            except Exception:
+                errors += 1
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if rate is None:
+        await asyncio.gather(*(request(i) for i in range(n_requests)))
+    else:
+        gaps = np.random.default_rng(0).exponential(1 / rate, n_requests)
+        tasks = []
+        for i in range(n_requests):
+            tasks.append(asyncio.ensure_future(request(i)))
+            await asyncio.sleep(gaps[i])
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return pd.Series({
+        "Requests": n_requests,
+        "Errors": errors,
+        "Throughput": n_requests / elapsed,
+        "p50 ms": p50,
+        "p90 ms": p90,
+        "p99 ms": p99,
+        "Max ms": latencies.max() * 1000
+    }, name="Load")
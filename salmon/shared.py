@@ -0,0 +1,257 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+
+from .solvers import _solve
+
+_backends = ("shared_memory", "memmap")
+
+# Python 3.13 can attach to a segment without registering it with the resource tracker
+_TRACK_OPTION = sys.version_info >= (3, 13)
+# Segments are only registered with the resource tracker on POSIX
+_TRACKED = os.name == "posix"
+
+
+class DesignHandle(namedtuple("DesignHandle", ["backend", "name", "shape", "columns", "response", "intercept", "weighted"])):
+    ''' A small, picklable description of a SharedDesign, which is all a worker process needs to attach to it.
+
+    The segment holds an (n x k) float array in column major order: the design columns, then the response,
+    then the weights if the model is weighted. Each column is a contiguous block of the segment.
+    '''
+    __slots__ = ()
+
+
+def _open_segment(name):
+    ''' Open an existing shared memory segment without registering it with this process' resource tracker,
+    which would otherwise unlink it (or warn about it) when an attaching process exits. Only the creator
+    of a segment is responsible for it. '''
+    if _TRACK_OPTION:
+        return shared_memory.SharedMemory(name=name, track=False)
+    segment = shared_memory.SharedMemory(name=name)
+    if _TRACKED:
+        # Attaching registered the segment, so only that registration is taken back
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+class _DesignSegment():
+    ''' Array views onto the columns of a shared design. '''
+
+    def _map(self, buffer):
+        n, k = self.handle.shape
+        self.array = np.ndarray((n, k), dtype=float, buffer=buffer, order="F")
+        p = len(self.handle.columns)
+        self.X = self.array[:, :p]
+        self.y = self.array[:, p]
+        self.weights = self.array[:, p + 1] if self.handle.weighted else None
+
+    def column(self, name):
+        ''' A zero-copy view of a single design column. '''
+        return self.X[:, self.handle.columns.index(name)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SharedDesign(_DesignSegment):
+    ''' The evaluated design (and response) of a fitted model, placed once in memory that other processes
+    can attach to by name, so process pools do not pickle the training data or design for every worker.
+
+    Use as a context manager: the segment (or memmap file) is removed when the block exits. Worker
+    processes attach with salmon.attach(design.handle), which gives zero-copy views of the same memory.
+    '''
+
+    def __init__(self, model, data=None, backend="shared_memory", path=None):
+        ''' Create a SharedDesign object. Usually done through LinearModel.share_design().
+
+        Arguments:
+            model - A LinearModel that has been fit on some data.
+            data - An optional DataFrame to evaluate the design on. Default is the training data.
+            backend - A str, either "shared_memory" (a multiprocessing.shared_memory segment) or "memmap"
+                (a memory mapped file, which also works across machines sharing a filesystem).
+            path - For the memmap backend, an optional str path of the file. By default a temporary file
+                is created and removed when the design is closed.
+        '''
+        if backend not in _backends:
+            raise ValueError("backend must be one of {}.".format(_backends))
+        snapshot = model.snapshot_
+        if data is None:
+            # Reuse the retained design if there is one, rather than evaluating it again
+            X, y = model.X_train_[snapshot.columns], model.y_train_
+            weights = model.weights_
+        else:
+            X = snapshot.explanatory.evaluate(data, fit=False)[snapshot.columns]
+            y = snapshot.response.evaluate(data, fit=False).iloc[:, 0]
+            weights = None
+        n, p = X.shape
+        k = p + 1 + (weights is not None)
+
+        self._owns_file = False
+        if backend == "shared_memory":
+            self._segment = shared_memory.SharedMemory(create=True, size=max(1, n * k * 8))
+            name, buffer = self._segment.name, self._segment.buf
+        else:
+            if path is None:
+                path = os.path.join(tempfile.gettempdir(), "salmon-design-{}.dat".format(uuid.uuid4().hex))
+                self._owns_file = True
+            self._segment = np.memmap(path, dtype=float, mode="w+", shape=(n, k), order="F")
+            name, buffer = path, self._segment
+
+        self.handle = DesignHandle(backend, name, (n, k), list(snapshot.columns), str(snapshot.response),
+                                   model.intercept, weights is not None)
+        self._map(buffer)
+        # Fill one column at a time so at most one extra column is ever materialized
+        for j, column in enumerate(self.handle.columns):
+            self.X[:, j] = X[column].to_numpy(dtype=float)
+        self.y[:] = np.asarray(y, dtype=float)
+        if weights is not None:
+            self.weights[:] = weights
+
+    def close(self):
+        ''' Release and remove the segment. Workers should have detached first. '''
+        if self._segment is None:
+            return
+        self.array = self.X = self.y = self.weights = None
+        if self.handle.backend == "shared_memory":
+            self._segment.close()
+            if _TRACKED and not _TRACK_OPTION:
+                # A worker sharing this process' resource tracker (e.g. a child process) took the registration back
+                # when it attached, so it is registered again for unlink to take back
+                resource_tracker.register(self._segment._name, "shared_memory")
+            self._segment.unlink()
+        else:
+            self._segment.flush()
+            del self._segment
+            if self._owns_file:
+                os.remove(self.handle.name)
+        self._segment = None
+
+
+class AttachedDesign(_DesignSegment):
+    ''' A worker's view of a SharedDesign. See salmon.attach. '''
+
+    def __init__(self, handle):
+        self.handle = handle
+        if handle.backend == "shared_memory":
+            self._segment = _open_segment(handle.name)
+            self._map(self._segment.buf)
+        else:
+            self._segment = np.memmap(handle.name, dtype=float, mode="r", shape=handle.shape, order="F")
+            self._map(self._segment)
+
+    def close(self):
+        ''' Detach from the segment, leaving it for its creator to remove. '''
+        if self._segment is None:
+            return
+        self.array = self.X = self.y = self.weights = None
+        if self.handle.backend == "shared_memory":
+            self._segment.close()
+        self._segment = None
+
+
+def attach(handle):
+    ''' Attach to a SharedDesign by its handle, e.g. in a worker process.
+
+    Arguments:
+        handle - The DesignHandle of a SharedDesign (SharedDesign.handle).
+
+    Returns:
+        An AttachedDesign with zero-copy X, y, and weights arrays. It can be used as a context manager.
+    '''
+    return AttachedDesign(handle)
+
+
+def fit_columns(design, columns=None, solver="auto"):
+    ''' Fit least squares on a subset of the columns of a shared design.
+
+    Arguments:
+        design - A SharedDesign or AttachedDesign.
+        columns - An optional list of design column names. Default is all of them.
+        solver - The least squares backend. See LinearModel.fit.
+
+    Returns:
+        A tuple of (Series of coefficients, sum of squared errors, residual degrees of freedom).
+    '''
+    handle = design.handle
+    columns = handle.columns if columns is None else list(columns)
+    positions = [handle.columns.index(column) for column in columns]
+    # A contiguous run of columns is a view, any other subset is gathered into one copy
+    if len(positions) and positions == list(range(positions[0], positions[0] + len(positions))):
+        X = design.X[:, positions[0]:positions[0] + len(positions)]
+    else:
+        X = design.X[:, positions]
+    y, weights = design.y, design.weights
+    n = len(y)
+
+    if handle.intercept:
+        X_offsets = np.average(X, axis=0, weights=weights) if len(positions) else np.zeros(0)
+        y_offset = np.average(y, weights=weights)
+    else:
+        X_offsets, y_offset = np.zeros(len(positions)), 0.0
+    if weights is None:
+        _, coef, _, _ = _solve(X, y - y_offset, X_offsets, solver)
+        residuals = y - y_offset - (X @ coef - X_offsets @ coef)
+        sse = residuals @ residuals
+    else:
+        root_weights = np.sqrt(weights)
+        Xw = X - X_offsets
+        Xw *= root_weights[:, np.newaxis]
+        yw = root_weights * (y - y_offset)
+        _, coef, _, _ = _solve(Xw, yw, np.zeros(len(positions)), solver)
+        residuals = yw - Xw @ coef
+        sse = residuals @ residuals
+
+    index = list(columns)
+    if handle.intercept:
+        coef = np.append(coef, y_offset - X_offsets @ coef)
+        index.append("Intercept")
+    rdf = n - len(positions) - (1 if handle.intercept else 0)
+    return pd.Series(coef, index=index, name="Coefficient"), sse, rdf
+
+
+_worker_design = dict()
+
+def _attach_worker(handle):
+    ''' Process pool initializer: attach once per worker, rather than sending the design with every task. '''
+    _worker_design["design"] = attach(handle)
+
+def _fit_worker(columns, solver):
+    return fit_columns(_worker_design["design"], columns, solver)
+
+
+def fit_subsets(design, subsets, n_jobs=1, solver="auto"):
+    ''' Fit least squares on many subsets of a shared design's columns, optionally in worker processes
+    that attach to the design by name.
+
+    Arguments:
+        design - A SharedDesign.
+        subsets - A list of lists of design column names.
+        n_jobs - An int number of worker processes. 1 fits in this process.
+        solver - The least squares backend. See LinearModel.fit.
+
+    Returns:
+        A tuple of (DataFrame of the SSE and residual degrees of freedom of each subset, list of coefficient Series).
+    '''
+    subsets = [list(subset) for subset in subsets]
+    if n_jobs == 1:
+        results = [fit_columns(design, subset, solver) for subset in subsets]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_worker, initargs=(design.handle,)) as pool:
+            results = list(pool.map(_fit_worker, subsets, [solver] * len(subsets)))
+
+    table = pd.DataFrame({
+        "SSE": [sse for coef, sse, rdf in results],
+        "DF": [rdf for coef, sse, rdf in results]
+    }, index=[" + ".join(subset) if subset else "1" for subset in subsets], columns=["SSE", "DF"])
+    return table, [coef for coef, sse, rdf in results]
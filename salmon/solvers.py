@@ -0,0 +1,311 @@
+import numpy as np
+
+import scipy.sparse as sparse
+from scipy.linalg import solve_triangular, cho_solve, cholesky, LinAlgError
+from scipy.sparse.linalg import LinearOperator, lsqr
+
+from abc import ABC, abstractmethod
+
+
+def qr_solve(Q, R, y):
+    r''' Solve least squares X \ y, given QR decomposition of X '''
+    _, p = R.shape
+    if p:
+        return solve_triangular(R, Q.T @ y, check_finite=False)
+    else:
+        return np.empty(shape=0)
+
+def cho_inv(R):
+    ''' Calculate inverse of X.T @ X, given Cholesky decomposition R.T @ R '''
+    _, p = R.shape
+    if p:
+        return cho_solve((R, False), np.identity(p), check_finite=False)
+    else:
+        return np.empty(shape=(0, 0))
+
+def _count_sketch(n, m, rng):
+    ''' A random (m x n) sparse CountSketch: each of the n rows is added, with a random sign, to one of m sketch rows. '''
+    rows = rng.integers(0, m, n)
+    signs = rng.choice([-1.0, 1.0], n)
+    return sparse.csr_matrix((signs, (rows, np.arange(n))), shape=(m, n))
+
+def _centered(X, offsets):
+    ''' A dense, centered version of the design. '''
+    if sparse.issparse(X):
+        X = X.toarray()
+    X = np.asarray(X, dtype=float)
+    # Designs that are already centered (e.g., weighted ones) are not copied again
+    return X - offsets if np.any(offsets) else X
+
+def _centered_gram(X, offsets):
+    ''' Compute (X - 1 offsets')'(X - 1 offsets') without forming the centered design. '''
+    n = X.shape[0]
+    gram = X.T @ X
+    if sparse.issparse(gram):
+        gram = gram.toarray()
+    column_sums = np.asarray(X.sum(axis=0)).ravel()
+    return (np.asarray(gram, dtype=float) - np.outer(column_sums, offsets) - np.outer(offsets, column_sums)
+            + n * np.outer(offsets, offsets))
+
+
+class Solver(ABC):
+    ''' A least squares backend for LinearModel.fit.
+
+    Solvers minimize ||(X - 1 offsets') b - y|| and also return an upper triangular R with
+    R'R = (X - 1 offsets')'(X - 1 offsets'), which LinearModel uses for the coefficient covariance and
+    interval widths. If the backend forms an orthonormal basis Q of the centered design it is returned
+    too, otherwise None is returned and it is recomputed if ever needed.
+    '''
+
+    name = None
+
+    # Whether the returned R (and so the standard errors) only approximates the exact factor
+    approximate = False
+
+    @abstractmethod
+    def solve(self, X, y, offsets):
+        ''' Solve the least squares problem.
+
+        Arguments:
+            X - An (n x p) ndarray (or scipy sparse matrix) of the uncentered design.
+            y - A length n ndarray of the (centered) response.
+            offsets - A length p ndarray of column offsets to subtract from X.
+
+        Returns:
+            A tuple of (coefficients, R, Q or None).
+        '''
+        pass
+
+    def __str__(self):
+        return self.name
+
+
+class QRSolver(Solver):
+    ''' Householder QR of the centered design. Accurate, and the default for small problems. '''
+
+    name = "qr"
+
+    def solve(self, X, y, offsets):
+        q, r = np.linalg.qr(_centered(X, offsets))
+        return qr_solve(q, r, y), r, q
+
+
+class CholeskySolver(Solver):
+    ''' Cholesky factorization of the normal equations.
+
+    Much faster than QR when n >> p, but squares the condition number of the design.
+    '''
+
+    name = "cholesky"
+
+    def solve(self, X, y, offsets):
+        gram = _centered_gram(X, offsets)
+        r = cholesky(gram, lower=False, check_finite=False) if len(gram) else np.empty(shape=(0, 0))
+        Xty = X.T @ y - offsets * y.sum()
+        coef = cho_solve((r, False), Xty, check_finite=False) if len(gram) else np.empty(shape=0)
+        return coef, r, None
+
+
+class SVDSolver(Solver):
+    ''' Thin SVD of the centered design. The most robust choice for nearly rank deficient designs. 
+    
+    Designs that are rank deficient (singular values below rcond times the largest) raise a LinAlgError,
+    like CholeskySolver, since their coefficient covariance is singular.
+    '''
+
+    name = "svd"
+
+    def __init__(self, rcond=1e-12):
+        self.rcond = rcond
+
+    def solve(self, X, y, offsets):
+        u, s, vt = np.linalg.svd(_centered(X, offsets), full_matrices=False)
+        keep = s > self.rcond * (s.max() if len(s) else 0)
+        if not keep.all():
+            raise LinAlgError("The design is rank deficient (rank {} with {} columns). "
+                              "Remove redundant terms.".format(keep.sum(), len(s)))
+        coef = vt.T @ ((u.T @ y) / s)
+        # X = U (S V') = (U Q2) R2, so the pair matches what a QR factorization would give
+        q2, r = np.linalg.qr(s[:, np.newaxis] * vt)
+        return coef, r, u @ q2
+
+
+class TSQRSolver(Solver):
+    ''' Blocked tall-skinny QR. Each block of rows is reduced to its R factor and the R factors are
+    combined, so only one block of the centered design is in memory at a time.
+    '''
+
+    name = "tsqr"
+
+    def __init__(self, block_rows=None):
+        self.block_rows = block_rows
+
+    def solve(self, X, y, offsets):
+        n, p = X.shape
+        block_rows = self.block_rows or max(4 * (p + 1), 2 ** 20 // (p + 1))
+        # Factor the augmented [X | y] so Q'y falls out of the combined R factor
+        factors = []
+        for start in range(0, n, block_rows):
+            block = np.column_stack([_centered(X[start:start + block_rows], offsets), y[start:start + block_rows]])
+            factors.append(np.linalg.qr(block, mode="r"))
+        r_aug = np.linalg.qr(np.vstack(factors), mode="r")
+        r, qty = r_aug[:p, :p], r_aug[:p, p]
+        coef = solve_triangular(r, qty, check_finite=False) if p else np.empty(shape=0)
+        return coef, r, None
+
+
+class LSQRSolver(Solver):
+    ''' Iterative LSQR, which only needs products with the design. Suited to sparse designs, as the
+    centering is applied implicitly and never densifies X.
+    '''
+
+    name = "lsqr"
+
+    def __init__(self, tol=1e-10, max_iter=None):
+        self.tol = tol
+        self.max_iter = max_iter
+
+    def solve(self, X, y, offsets):
+        n, p = X.shape
+        operator = LinearOperator(
+            shape=(n, p), dtype=float,
+            matvec=lambda v: X @ np.ravel(v) - offsets @ np.ravel(v),
+            rmatvec=lambda u: X.T @ np.ravel(u) - offsets * np.ravel(u).sum()
+        )
+        coef = lsqr(operator, y, atol=self.tol, btol=self.tol, iter_lim=self.max_iter)[0]
+        r = cholesky(_centered_gram(X, offsets), lower=False, check_finite=False)
+        return coef, r, None
+
+
+class SketchSolver(Solver):
+    ''' Randomized sketch-and-precondition least squares for very tall designs.
+
+    A CountSketch compresses the centered design to a few thousand rows in a single pass, and the R factor
+    of the sketch preconditions LSQR on the full problem so it converges to tol in a handful of iterations.
+    With sketch_only=True the sketched problem is solved directly instead, skipping the LSQR passes.
+
+    The returned R is that of the sketch, so standard errors and intervals are approximate either way.
+    '''
+
+    name = "sketch"
+    approximate = True
+
+    def __init__(self, sketch_rows=None, tol=1e-10, max_iter=None, sketch_only=False, seed=None):
+        self.sketch_rows = sketch_rows
+        self.tol = tol
+        self.max_iter = max_iter
+        self.sketch_only = sketch_only
+        self.seed = seed
+
+    def _sketch(self, X, y, offsets):
+        ''' Apply a CountSketch to the augmented, centered [X | y]. '''
+        n, p = X.shape
+        m = min(n, self.sketch_rows or max(1000, 20 * p, p * p))
+        S = _count_sketch(n, m, np.random.default_rng(self.seed))
+        SX = S @ X
+        if sparse.issparse(SX):
+            SX = SX.toarray()
+        S1 = np.asarray(S.sum(axis=1)).ravel()
+        return np.column_stack([np.asarray(SX, dtype=float) - np.outer(S1, offsets), S @ y])
+
+    def solve(self, X, y, offsets):
+        n, p = X.shape
+        if p == 0:
+            return np.empty(shape=0), np.empty(shape=(0, 0)), None
+        q_s, r_aug = np.linalg.qr(self._sketch(X, y, offsets))
+        r = r_aug[:p, :p]
+        if self.sketch_only:
+            return solve_triangular(r, r_aug[:p, p], check_finite=False), r, None
+
+        # LSQR on the right preconditioned problem min ||X_c R^-1 z - y||, then b = R^-1 z
+        def matvec(v):
+            b = solve_triangular(r, np.ravel(v), check_finite=False)
+            return X @ b - offsets @ b
+
+        def rmatvec(u):
+            u = np.ravel(u)
+            return solve_triangular(r, X.T @ u - offsets * u.sum(), trans='T', check_finite=False)
+
+        operator = LinearOperator(shape=(n, p), dtype=float, matvec=matvec, rmatvec=rmatvec)
+        z = lsqr(operator, y, atol=self.tol, btol=self.tol, iter_lim=self.max_iter)[0]
+        return solve_triangular(r, z, check_finite=False), r, None
+
+
+_solvers = dict(
+    qr=QRSolver,
+    cholesky=CholeskySolver,
+    svd=SVDSolver,
+    tsqr=TSQRSolver,
+    lsqr=LSQRSolver,
+    sketch=SketchSolver,
+)
+
+# Problems with at most this many design elements always use QR
+_SMALL_PROBLEM_ELEMENTS = 2 ** 20
+
+# Designs with at most this fraction of nonzero entries are treated as sparse
+_SPARSE_DENSITY = 0.05
+
+# The Cholesky path is abandoned if the estimated condition number of the Gram matrix exceeds this
+_MAX_GRAM_CONDITION = 1e10
+
+def _auto_solver(X):
+    ''' Choose a backend from the shape, sparsity and size of the design. '''
+    n, p = X.shape
+    if sparse.issparse(X):
+        return "lsqr" if n * p > _SMALL_PROBLEM_ELEMENTS else "qr"
+    if n * p <= _SMALL_PROBLEM_ELEMENTS:
+        return "qr"
+    if np.count_nonzero(X) <= _SPARSE_DENSITY * n * p:
+        return "lsqr"
+    if n >= 10 * p:
+        return "cholesky"
+    return "tsqr"
+
+def _well_conditioned(r):
+    ''' Cheap check on a Cholesky factor: the squared ratio of its extreme diagonal entries bounds the
+    condition number of the Gram matrix from below. '''
+    diagonal = np.abs(np.diagonal(r))
+    if len(diagonal) == 0:
+        return True
+    return diagonal.min() > 0 and (diagonal.max() / diagonal.min()) ** 2 < _MAX_GRAM_CONDITION
+
+def _solve(X, y, offsets, solver="auto"):
+    ''' Solve a centered least squares problem with the requested backend.
+
+    Arguments:
+        X - An (n x p) ndarray (or scipy sparse matrix) of the uncentered design.
+        y - A length n ndarray of the (centered) response.
+        offsets - A length p ndarray of column offsets to subtract from X.
+        solver - A str naming a backend ("qr", "cholesky", "svd", "tsqr", "lsqr", "sketch"), a Solver object, or
+            "auto" to choose one based on the size, shape, sparsity and conditioning of the problem.
+
+    Returns:
+        A tuple of (Solver used, coefficients, R, Q or None).
+    '''
+    if isinstance(solver, Solver):
+        return (solver,) + tuple(solver.solve(X, y, offsets))
+
+    name = _auto_solver(X) if solver == "auto" else solver
+    if name not in _solvers:
+        raise KeyError("Solver '{}' not supported. The following solvers are supported: {}".format(
+            name,
+            list(_solvers.keys())
+        ))
+    if name == "lsqr" and not sparse.issparse(X):
+        X = sparse.csr_matrix(X)
+
+    if solver == "auto" and name in ("cholesky", "lsqr"):
+        # The normal equations square the condition number, so fall back to an orthogonal method if needed
+        try:
+            backend = _solvers[name]()
+            coef, r, q = backend.solve(X, y, offsets)
+            if _well_conditioned(r):
+                return backend, coef, r, q
+        except LinAlgError:
+            pass
+        name = "tsqr" if not sparse.issparse(X) else "qr"
+
+    backend = _solvers[name]()
+    coef, r, q = backend.solve(X, y, offsets)
+    return backend, coef, r, q
@@ -0,0 +1,246 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pandas.api.types import union_categoricals
+
+
+class ColumnSource(ABC):
+    ''' A table whose columns are only read when they are asked for.
+
+    Expressions evaluate on a ColumnSource just like on a DataFrame, and LinearModel.fit reads only the
+    columns its Expressions (and options like weights or absorb) name. Columns are handed to pandas
+    without copying wherever the underlying storage allows it.
+    '''
+
+    @property
+    @abstractmethod
+    def columns(self):
+        ''' A list of the available column names. '''
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    @abstractmethod
+    def _read(self, name):
+        ''' Read a single column as a 1D array, without copying if possible. '''
+        pass
+
+    @property
+    def index(self):
+        return pd.RangeIndex(len(self))
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        if isinstance(name, (list, tuple)):
+            return self.to_frame(name)
+        if name not in self:
+            raise KeyError(name)
+        return pd.Series(self._read(name), index=self.index, name=name, copy=False)
+
+    def to_frame(self, names=None):
+        ''' Read some (by default all) of the columns into a DataFrame. '''
+        names = self.columns if names is None else list(names)
+        return pd.DataFrame({name: self[name] for name in names}, index=self.index, columns=names)
+
+
+class ArraySource(ColumnSource):
+    ''' Columns from a mapping of names to 1D arrays, e.g. np.memmap or np.load(..., mmap_mode="r") arrays. '''
+
+    def __init__(self, arrays):
+        ''' Create an ArraySource object.
+
+        Arguments:
+            arrays - A dict mapping column names to 1D arrays of the same length.
+        '''
+        self.arrays = arrays
+        lengths = set(len(values) for values in arrays.values())
+        if len(lengths) > 1:
+            raise ValueError("All columns must have the same length.")
+        self._length = lengths.pop() if lengths else 0
+
+    @property
+    def columns(self):
+        return list(self.arrays)
+
+    def __len__(self):
+        return self._length
+
+    def _read(self, name):
+        return np.asarray(self.arrays[name])
+
+
+class NpySource(ColumnSource):
+    ''' Columns stored as one .npy file per column in a directory (e.g. written with np.save(name + ".npy", values)).
+    Numeric and fixed width string columns are memory mapped, so only the pages that are used get read.
+    '''
+
+    def __init__(self, path, mmap_mode="r", allow_pickle=False):
+        ''' Create an NpySource object.
+
+        Arguments:
+            path - A str path to the directory.
+            mmap_mode - The mmap_mode for np.load. None reads columns fully into memory.
+            allow_pickle - Whether object columns (which cannot be memory mapped) may be loaded.
+        '''
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.allow_pickle = allow_pickle
+        self._columns = sorted(file[:-4] for file in os.listdir(path) if file.endswith(".npy"))
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __len__(self):
+        return len(self._read(self._columns[0])) if self._columns else 0
+
+    def _read(self, name):
+        file = os.path.join(self.path, name + ".npy")
+        try:
+            return np.load(file, mmap_mode=self.mmap_mode, allow_pickle=self.allow_pickle)
+        except ValueError:
+            # Object arrays cannot be memory mapped
+            return np.load(file, allow_pickle=self.allow_pickle)
+
+
+class ArrowSource(ColumnSource):
+    ''' Columns of a pyarrow Table (or RecordBatch). Single chunk numeric columns without nulls are zero-copy. '''
+
+    def __init__(self, table):
+        ''' Create an ArrowSource object.
+
+        Arguments:
+            table - A pyarrow Table or RecordBatch.
+        '''
+        self.table = table
+
+    @property
+    def columns(self):
+        return list(self.table.column_names)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def _read(self, name):
+        column = self.table.column(name)
+        if getattr(column, "num_chunks", 1) == 1:
+            chunk = column.chunk(0) if hasattr(column, "chunk") else column
+            return chunk.to_numpy(zero_copy_only=False)
+        return column.to_numpy()
+
+
+class ParquetSource(ColumnSource):
+    ''' Columns of a Parquet file, read with pyarrow only when (and only the ones) needed. Each column is read
+    from the file once and then kept, as evaluating Expressions asks for the same column many times.
+    '''
+
+    def __init__(self, path):
+        ''' Create a ParquetSource object. Requires pyarrow.
+
+        Arguments:
+            path - A str path to a Parquet file.
+        '''
+        import pyarrow.parquet as pq
+        self.path = path
+        self.file = pq.ParquetFile(path)
+        self._cache = dict()
+
+    @property
+    def columns(self):
+        return list(self.file.schema_arrow.names)
+
+    def __len__(self):
+        return self.file.metadata.num_rows
+
+    def _read(self, name):
+        if name not in self._cache:
+            self._load([name])
+        return self._cache[name]
+
+    def _load(self, names):
+        # All of the columns are read in one pass over the file
+        table = ArrowSource(self.file.read(columns=names))
+        for name in names:
+            self._cache[name] = table._read(name)
+
+    def to_frame(self, names=None):
+        names = self.columns if names is None else list(names)
+        missing = list(OrderedDict.fromkeys(name for name in names if name not in self._cache))
+        if missing:
+            self._load(missing)
+        return super().to_frame(names)
+
+
+def as_source(data):
+    ''' Wrap data for evaluating Expressions on.
+
+    Arguments:
+        data - A DataFrame or ColumnSource (returned as is), a dict of arrays, a pyarrow Table, or a str path
+            to either a directory of .npy columns or a Parquet file.
+
+    Returns:
+        A DataFrame or ColumnSource.
+    '''
+    if isinstance(data, (pd.DataFrame, ColumnSource)):
+        return data
+    if isinstance(data, dict):
+        return ArraySource(data)
+    if isinstance(data, str):
+        if os.path.isdir(data):
+            return NpySource(data)
+        return ParquetSource(data)
+    if hasattr(data, "column_names") and hasattr(data, "num_rows"):
+        return ArrowSource(data)
+    raise TypeError("Cannot read columns from a " + type(data).__name__ + ".")
+
+
+def _concat_chunks(chunks):
+    ''' Concatenate DataFrame chunks, merging the categories of category columns (which differ between chunks). '''
+    columns = OrderedDict()
+    for name in chunks[0].columns:
+        if isinstance(chunks[0][name].dtype, pd.CategoricalDtype):
+            columns[name] = pd.Series(union_categoricals([chunk[name] for chunk in chunks]), name=name)
+        else:
+            columns[name] = pd.concat([chunk[name] for chunk in chunks], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def _as_categories(data, names):
+    ''' Convert columns to pandas categories after parsing, so their values keep the parsed types. '''
+    for name in names:
+        data[name] = data[name].astype("category")
+    return data
+
+
+def _read_csv(path, names, dtypes, chunksize=None, read_options=None):
+    ''' Read only some columns of a CSV file, with the given dtypes.
+
+    Columns with the "category" dtype are parsed with the type pandas infers and only then converted, since
+    pandas would otherwise parse their values as strings (e.g. levels '1', '2' of an int coded factor).
+
+    Arguments:
+        path - A str path (or buffer) of a CSV file.
+        names - A collection of the column names to read.
+        dtypes - A dict mapping column names to dtypes.
+        chunksize - An optional int number of rows to parse at a time.
+        read_options - An optional dict of other keyword arguments for pd.read_csv.
+
+    Returns:
+        A DataFrame, or an iterator of DataFrames if chunksize is given.
+    '''
+    options = dict(read_options or {})
+    options["usecols"] = sorted(names)
+    categories = [name for name, dtype in dtypes.items() if name in names and dtype == "category"]
+    options["dtype"] = {name: dtype for name, dtype in dtypes.items() if name in names and dtype != "category"}
+    data = pd.read_csv(path, chunksize=chunksize, **options)
+    if chunksize is None:
+        return _as_categories(data, categories)
+    return (_as_categories(chunk, categories) for chunk in data)
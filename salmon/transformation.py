@@ -2,6 +2,31 @@ import pandas as pd
 import numpy as np
 
 
+# Rows per block when a chain of ufuncs is applied in place, so each block stays in cache across the chain
+_BLOCK_ROWS = 16384
+
+def _chain(ufuncs):
+    ''' A function applying (ufunc, argument) steps in turn, e.g. [(np.add, 1), (np.log, None)] for log(x+1). '''
+    def func(values):
+        for ufunc, arg in ufuncs:
+            values = ufunc(values) if arg is None else ufunc(values, arg)
+        return values
+    return func
+
+def _apply_inplace(out, ufuncs, block_rows=_BLOCK_ROWS):
+    ''' Apply (ufunc, argument) steps to a 1D float array in place, running the whole chain over one block
+    of rows at a time rather than making a pass over the column (and a new column) for every step. '''
+    if not ufuncs:
+        return out
+    for start in range(0, len(out), block_rows):
+        block = out[start:start + block_rows]
+        for ufunc, arg in ufuncs:
+            if arg is None:
+                ufunc(block, out=block)
+            else:
+                ufunc(block, arg, out=block)
+    return out
+
 # This is a class to package together the logic of how to transform
 # with how to display / print the transformation
 
@@ -10,19 +35,26 @@ class Transformation():
     on data as well as some helper information for printing and visualizing. 
     '''
     
-    def __init__(self, func, pattern, name, inverse = None):
+    stateful = False
+
+    def __init__(self, func, pattern, name, inverse = None, arg = None, ufuncs = None):
         ''' Creates a Transformation object.
 
         Arguments:
-            func - A function to be applied to a column of data in a DataFrame.
+            func - A function to be applied to a column of data in a DataFrame. May be None if ufuncs is given.
             pattern - A str holding a template for printing.
             name - A str describing the transformation.
             inverse - An optional function that will undo the func operation.
+            arg - An optional parameter the transformation was created with (e.g. the exponent of a Power).
+            ufuncs - An optional list of (NumPy ufunc, argument or None) steps equivalent to func, which lets 
+                the transformation be fused with others and applied in place (see TransVar.evaluate).
         '''
-        self.func = func
+        self.func = _chain(ufuncs) if func is None else func
         self.pattern = pattern
         self.inverse = inverse
         self.name = name
+        self.arg = arg
+        self.ufuncs = ufuncs
         
     def __str__(self):
         ''' Returns the given pattern for debugging. '''
@@ -73,10 +105,37 @@ class Transformation():
             A trasnformed Series. 
         '''
         return self.func(values)
+
+    def fit(self, values):
+        ''' Learn any statistics the transformation needs from training values. Only stateful transformations learn anything. '''
+        pass
+
+    def steps(self):
+        ''' The (ufunc, argument) steps of the transformation, or None if it is an opaque function. '''
+        return self.ufuncs
     
     def copy(self):
         ''' Returns a deep copy of the Transformation. '''
-        return Transformation(self.func, self.pattern, self.name, self.inverse)
+        return Transformation(self.func, self.pattern, self.name, self.inverse, self.arg, self.ufuncs)
+
+    def _to_spec(self):
+        ''' Describe the Transformation as a JSON compatible dictionary. Only named transformations are supported. '''
+        if _transformations_by_name.get(self.name) is None:
+            raise Exception("Cannot serialize custom transformation " + self.name + ".")
+        return {"name": self.name, "arg": self.arg}
+
+    def _to_source(self, inner):
+        ''' Write the Transformation as NumPy source code.
+
+        Arguments:
+            inner - A str of source code for the values being transformed.
+
+        Returns:
+            A str of source code that computes the transformed values.
+        '''
+        if self.name not in _source_patterns:
+            raise Exception("Cannot generate source code for custom transformation " + self.name + ".")
+        return _source_patterns[self.name].format(inner, arg = repr(self.arg))
 
     def invert(self, data):
         ''' If available, invert the data.
@@ -92,7 +151,98 @@ class Transformation():
 
         return self.inverse(data)
 
-class Center(Transformation):
+class _RunningMoments(Transformation):
+    ''' A stateful Transformation whose statistics (count, mean and sum of squared deviations) are learned 
+    incrementally, so it can be fit on chunks of data or on shards in other processes.
+
+    partial_fit merges the moments of each (cache sized) block of rows into the running ones with Chan et al.'s
+    pairwise update, which needs one pass over the data and stays accurate where sums of squares do not.
+    merge combines the moments of separately fit copies. freeze stops fitting, so a transformation fit on 
+    more data than a model sees (e.g. streamed before fitting on a sample) keeps its statistics.
+    '''
+
+    def _reset_moments(self):
+        self.count_ = 0
+        self.m2_ = 0.0
+        self.frozen = False
+
+    @property
+    def stateful(self):
+        return not self.frozen
+
+    def reset(self):
+        ''' Forget the learned statistics (unless the transformation is frozen). '''
+        if not self.frozen:
+            self.count_, self.past_mean, self.m2_ = 0, 0.0, 0.0
+            self._update_statistics()
+
+    def fit(self, values):
+        self.reset()
+        self.partial_fit(values)
+
+    def partial_fit(self, values):
+        ''' Update the statistics with more values, e.g. the next chunk of a column. Missing values are skipped.
+
+        Arguments:
+            values - A Series or array of values.
+
+        Returns:
+            The Transformation itself.
+        '''
+        if self.frozen:
+            return self
+        values = np.asarray(values, dtype = float)
+        for start in range(0, len(values), _BLOCK_ROWS):
+            block = values[start:start + _BLOCK_ROWS]
+            block = block[~np.isnan(block)]
+            if len(block):
+                mean = block.mean()
+                deviations = block - mean
+                self._combine(len(block), mean, deviations @ deviations)
+        self._update_statistics()
+        return self
+
+    def merge(self, other):
+        ''' Combine the statistics of another copy of this transformation fit on other values (e.g. another 
+        shard of the data, fit in another process), as if both had been fit on all of the values.
+
+        Arguments:
+            other - A Transformation of the same type.
+
+        Returns:
+            The Transformation itself.
+        '''
+        if type(other) is not type(self):
+            raise Exception("Cannot merge a " + type(other).__name__ + " into a " + type(self).__name__ + ".")
+        if self.frozen:
+            raise Exception("Cannot merge into a frozen " + self.name + " transformation.")
+        self._combine(other.count_, other.past_mean, other.m2_)
+        self._update_statistics()
+        return self
+
+    def freeze(self):
+        ''' Keep the current statistics: fitting (including fitting a model with this transformation) no 
+        longer changes them. Returns the Transformation itself. '''
+        self.frozen = True
+        return self
+
+    def _combine(self, count, mean, m2):
+        if count == 0:
+            return
+        total = self.count_ + count
+        delta = mean - self.past_mean
+        self.past_mean = self.past_mean + delta * count / total
+        self.m2_ = self.m2_ + m2 + delta * delta * self.count_ * count / total
+        self.count_ = total
+
+    def _update_statistics(self):
+        pass
+
+    def _copy_moments(self, other):
+        other.count_, other.m2_, other.frozen = self.count_, self.m2_, self.frozen
+        return other
+
+class Center(_RunningMoments):
     ''' A specific type of Trasnformation for centering data so that it has a mean of 0. '''
 
     def __init__(self):
@@ -100,57 +250,90 @@ class Center(Transformation):
         self.pattern = "{0}-E({0})"
         self.past_mean = 0
         self.name = "Center"
+        self._reset_moments()
         
     def transform(self, values, training = True):
         if training:
-            self.past_mean = values.mean()
+            self.fit(values)
         
         return values - self.past_mean
+
+    def steps(self):
+        return [(np.subtract, self.past_mean)]
     
     def copy(self):
         ret_val = Center()
         ret_val.past_mean = self.past_mean
-        return ret_val
+        return self._copy_moments(ret_val)
+
+    def _to_spec(self):
+        return {"name": self.name, "past_mean": float(self.past_mean)}
+
+    def _to_source(self, inner):
+        return "(({}) - {!r})".format(inner, float(self.past_mean))
 
     def invert(self, data):
         return data + self.past_mean
 
-class Standardize(Transformation):
+class Standardize(_RunningMoments):
     ''' A specific type of Transformation that standardizes the data so that it has a mean of 0 and standard deviation of 1. '''
+
     def __init__(self):
         ''' Create a Standardize object. '''
         self.pattern = "({0}-E({0}))/Std({0})"
         self.past_mean = 0
         self.past_std = 1
         self.name = "Standardize"
+        self._reset_moments()
         
     def transform(self, values, training = True):
         if training:
-            self.past_mean = values.mean()
-            self.past_std = values.std()
+            self.fit(values)
             
         return (values - self.past_mean) / self.past_std    
+
+    def _update_statistics(self):
+        # The sample standard deviation, as by pandas
+        self.past_std = np.sqrt(self.m2_ / (self.count_ - 1)) if self.count_ > 1 else np.nan
+
+    def steps(self):
+        return [(np.subtract, self.past_mean), (np.divide, self.past_std)]
     
     def copy(self):
         ret_val = Standardize()
         ret_val.past_mean, ret_val.past_std = self.past_mean, self.past_std
-        return ret_val
+        return self._copy_moments(ret_val)
+
+    def _to_spec(self):
+        return {"name": self.name, "past_mean": float(self.past_mean), "past_std": float(self.past_std)}
+
+    def _to_source(self, inner):
+        return "((({}) - {!r}) / {!r})".format(inner, float(self.past_mean), float(self.past_std))
 
     def invert(self, data):
         return (data * self.past_std) + self.past_mean
     
+def _power_ufuncs(power):
+    ''' Steps for raising to a power. Like the ** operator, common exponents use their own (much faster) ufuncs. '''
+    if power == 1:
+        return []
+    special = {2: np.square, 0.5: np.sqrt, -1: np.reciprocal}
+    if power in special:
+        return [(special[power], None)]
+    return [(np.power, power)]
+
 # Aliases for common Transformations
-Sin = lambda i: Transformation(np.sin, "sin({})", "Sine")
-Cos = lambda i: Transformation(np.cos, "cos({})", "Cosine")
-Log = lambda i: Transformation(np.log, "log({})", "Natural Log", np.exp)
-Log10 = lambda i: Transformation(np.log10, "log({})", "Log Base 10", lambda x: 10 * x)
-Exp = lambda i: Transformation(np.exp, "exp({})", "Exponential", np.log)
+Sin = lambda i: Transformation(None, "sin({})", "Sine", ufuncs = [(np.sin, None)])
+Cos = lambda i: Transformation(None, "cos({})", "Cosine", ufuncs = [(np.cos, None)])
+Log = lambda i: Transformation(None, "log({})", "Natural Log", np.exp, ufuncs = [(np.log, None)])
+Log10 = lambda i: Transformation(None, "log({})", "Log Base 10", lambda x: 10 * x, ufuncs = [(np.log10, None)])
+Exp = lambda i: Transformation(None, "exp({})", "Exponential", np.log, ufuncs = [(np.exp, None)])
 Std = lambda i: Standardize()
 Cen = lambda i: Center()
-Identity = lambda i: Transformation(lambda x: x, "{}", "Identity", lambda x: x)
-Increment = lambda i: Transformation(lambda x: x + i, "{}+"+str(i) if i >= 0 else "{}-"+str(-i), "Increment", lambda x: x - i)
-Multiply = lambda i: Transformation(lambda x: x * i, str(i) + "*{}", "Multiply", lambda x: x * (1/i))
-Power = lambda i: Transformation(lambda x: x ** i, "{}^" + str(i), "Power", lambda x: x ** (1/i) if i % 2 == 1 else x.clip(0, None) ** (1/i))
+Identity = lambda i: Transformation(lambda x: x, "{}", "Identity", lambda x: x, ufuncs = [])
+Increment = lambda i: Transformation(None, "{}+"+str(i) if i >= 0 else "{}-"+str(-i), "Increment", lambda x: x - i, i, [(np.add, i)])
+Multiply = lambda i: Transformation(None, str(i) + "*{}", "Multiply", lambda x: x * (1/i), i, [(np.multiply, i)])
+Power = lambda i: Transformation(None, "{}^" + str(i), "Power", lambda x: x ** (1/i) if i % 2 == 1 else x.clip(0, None) ** (1/i), i, _power_ufuncs(i))
 
 _default_transformations = {
     "sin" : Sin,
@@ -161,4 +344,41 @@ _default_transformations = {
     "standardize" : Std,
     "center": Cen,
     "identity": Identity
-}
\ No newline at end of file
+}
+
+# Used to rebuild Transformations from their names, e.g. when loading a saved model
+_transformations_by_name = {
+    "Sine": Sin,
+    "Cosine": Cos,
+    "Natural Log": Log,
+    "Log Base 10": Log10,
+    "Exponential": Exp,
+    "Standardize": Std,
+    "Center": Cen,
+    "Identity": Identity,
+    "Increment": Increment,
+    "Multiply": Multiply,
+    "Power": Power
+}
+
+def _from_spec(spec):
+    ''' Rebuild a Transformation from the dictionary produced by Transformation._to_spec. '''
+    transformation = _transformations_by_name[spec["name"]](spec.get("arg"))
+    if "past_mean" in spec:
+        transformation.past_mean = spec["past_mean"]
+    if "past_std" in spec:
+        transformation.past_std = spec["past_std"]
+    return transformation
+
+# NumPy source code templates for named Transformations, used when generating standalone scoring functions
+_source_patterns = {
+    "Sine": "np.sin({0})",
+    "Cosine": "np.cos({0})",
+    "Natural Log": "np.log({0})",
+    "Log Base 10": "np.log10({0})",
+    "Exponential": "np.exp({0})",
+    "Identity": "({0})",
+    "Increment": "(({0}) + {arg})",
+    "Multiply": "({arg} * ({0}))",
+    "Power": "(({0}) ** {arg})"
+}